@@ -0,0 +1,460 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+import sys, time, threading
+from bitboard import *
+from piece import Move, Crowning, to_game_move
+from movecode import game_move_to_code
+from transposition import *
+from appconfig import AppConfig
+
+MATE = 100000
+INFINITY = 1000000
+
+#Deepest iteration when the depth is not limited
+MAX_DEPTH = 32
+
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 0)
+
+#Piece-square tables from white's point of view, indexed by square
+#(a8 first). Black uses the vertically mirrored square (sq ^ 56).
+_PST = {
+	PAWN : (
+		 0,  0,  0,  0,  0,  0,  0,  0,
+		50, 50, 50, 50, 50, 50, 50, 50,
+		10, 10, 20, 30, 30, 20, 10, 10,
+		 5,  5, 10, 25, 25, 10,  5,  5,
+		 0,  0,  0, 20, 20,  0,  0,  0,
+		 5, -5,-10,  0,  0,-10, -5,  5,
+		 5, 10, 10,-20,-20, 10, 10,  5,
+		 0,  0,  0,  0,  0,  0,  0,  0),
+	KNIGHT : (
+		-50,-40,-30,-30,-30,-30,-40,-50,
+		-40,-20,  0,  0,  0,  0,-20,-40,
+		-30,  0, 10, 15, 15, 10,  0,-30,
+		-30,  5, 15, 20, 20, 15,  5,-30,
+		-30,  0, 15, 20, 20, 15,  0,-30,
+		-30,  5, 10, 15, 15, 10,  5,-30,
+		-40,-20,  0,  5,  5,  0,-20,-40,
+		-50,-40,-30,-30,-30,-30,-40,-50),
+	BISHOP : (
+		-20,-10,-10,-10,-10,-10,-10,-20,
+		-10,  0,  0,  0,  0,  0,  0,-10,
+		-10,  0,  5, 10, 10,  5,  0,-10,
+		-10,  5,  5, 10, 10,  5,  5,-10,
+		-10,  0, 10, 10, 10, 10,  0,-10,
+		-10, 10, 10, 10, 10, 10, 10,-10,
+		-10,  5,  0,  0,  0,  0,  5,-10,
+		-20,-10,-10,-10,-10,-10,-10,-20),
+	ROOK : (
+		 0,  0,  0,  0,  0,  0,  0,  0,
+		 5, 10, 10, 10, 10, 10, 10,  5,
+		-5,  0,  0,  0,  0,  0,  0, -5,
+		-5,  0,  0,  0,  0,  0,  0, -5,
+		-5,  0,  0,  0,  0,  0,  0, -5,
+		-5,  0,  0,  0,  0,  0,  0, -5,
+		-5,  0,  0,  0,  0,  0,  0, -5,
+		 0,  0,  0,  5,  5,  0,  0,  0),
+	QUEEN : (
+		-20,-10,-10, -5, -5,-10,-10,-20,
+		-10,  0,  0,  0,  0,  0,  0,-10,
+		-10,  0,  5,  5,  5,  5,  0,-10,
+		 -5,  0,  5,  5,  5,  5,  0, -5,
+		  0,  0,  5,  5,  5,  5,  0, -5,
+		-10,  5,  5,  5,  5,  5,  0,-10,
+		-10,  0,  5,  0,  0,  0,  0,-10,
+		-20,-10,-10, -5, -5,-10,-10,-20),
+	KING : (
+		-30,-40,-40,-50,-50,-40,-40,-30,
+		-30,-40,-40,-50,-50,-40,-40,-30,
+		-30,-40,-40,-50,-50,-40,-40,-30,
+		-30,-40,-40,-50,-50,-40,-40,-30,
+		-20,-30,-30,-40,-40,-30,-30,-20,
+		-10,-20,-20,-20,-20,-20,-20,-10,
+		 20, 20,  0,  0,  0,  0, 20, 20,
+		 20, 30, 10,  0,  0, 10, 30, 20),
+}
+
+#Value of each piece on each square, indexed by mailbox code * 64 + square
+SQUARE_VALUES = [0] * (15 * 64)
+for _ptype, _table in _PST.items():
+	for _sq in range(64):
+		SQUARE_VALUES[((WHITE << 3) | _ptype) * 64 + _sq] = \
+			PIECE_VALUES[_ptype] + _table[_sq]
+		SQUARE_VALUES[((BLACK << 3) | _ptype) * 64 + _sq] = \
+			PIECE_VALUES[_ptype] + _table[_sq ^ 56]
+
+def evaluate(position):
+	'''Static evaluation in centipawns from the side to move's view.'''
+	score = 0
+	mailbox = position.mailbox
+	for sq in iter_squares(position.occupied[WHITE]):
+		score += SQUARE_VALUES[mailbox[sq] * 64 + sq]
+	for sq in iter_squares(position.occupied[BLACK]):
+		score -= SQUARE_VALUES[mailbox[sq] * 64 + sq]
+	if position.turn == BLACK:
+		return -score
+	return score
+
+
+def score_to_tt(score, ply):
+	'''Mate scores are stored relative to the node, not the root.'''
+	if score >= MATE - 1000:
+		return score + ply
+	if score <= -MATE + 1000:
+		return score - ply
+	return score
+
+def score_from_tt(score, ply):
+	if score >= MATE - 1000:
+		return score - ply
+	if score <= -MATE + 1000:
+		return score + ply
+	return score
+
+
+class AlphaBetaEngine:
+	'''Built-in chess engine. It has the same interface as the GnuChess
+	wrapper (move and close), so it can replace it when the external
+	engine cannot be run.
+
+	The search is an iterative deepening alpha-beta with quiescence
+	search on captures. Results are kept in a transposition table of
+	hash_mb megabytes (AppConfig.hash_size_mb by default). Moves are 
+	ordered by the table's best move, captures (most valuable victim 
+	first) and killer moves. It stops at max_depth or when the node or
+	time budget runs out, returning the best move of the deepest 
+	completed iteration.
+
+	After each move it can ponder: search the position after the reply
+	it expects while the player thinks (see ponder and ponder_answer).'''
+
+	def __init__(self, max_depth = 4, max_nodes = 30000, max_time = 3.0,
+			hash_mb = None):
+		self.max_depth = max_depth
+		self.max_nodes = max_nodes
+		self.max_time = max_time
+
+		if hash_mb is None:
+			hash_mb = AppConfig.hash_size_mb
+		self.tt = TranspositionTable(hash_mb)
+
+		self.position = from_fen(START_FEN)
+
+		#Search statistics (for the last search)
+		self.nodes = 0
+		self.depth = 0
+		self.elapsed = 0.0
+		self.t_ini = 0.0
+
+		#Pondering: expected reply (as a Position and a game move), what
+		#became of it (None, "pondering", "hit" or "miss") and the answer
+		#found for it. The lock guards the state and the search budget,
+		#which ponder_answer changes from another thread.
+		self.ponder_move = None
+		self.ponder_game_move = None
+		self.ponder_state = None
+		self.ponder_result = None
+		self.ponder_lock = threading.Lock()
+
+	def move(self, move):
+		'''Play a player's move and return the engine's answer.'''
+		move = self.to_position_move(move)
+		self.position.make_move(move)
+
+		if self.ponder_state == "hit" and self.ponder_result is not None:
+			print "Ponder hit, answering with the pondered move"
+			best = self.ponder_result
+		else:
+			best = self.search()
+		if best is None:
+			raise Exception("IA Error: no legal moves")
+		self.position.make_move(best)
+
+		self.ponder_lock.acquire()
+		self.ponder_move = self.expected_reply()
+		self.ponder_game_move = self.ponder_move and self.to_game_move(self.ponder_move)
+		self.ponder_state = self.ponder_result = None
+		self.ponder_lock.release()
+		return self.to_game_move(best)
+
+	def expected_reply(self):
+		'''The opponent's best move according to the transposition
+		table, if it has one.'''
+		entry = self.tt.probe(self.position.hash)
+		if entry is None or entry[3] is None:
+			return None
+		for move in self.position.legal_moves():
+			if move == entry[3]:
+				return move
+		return None
+
+	def play(self, move):
+		'''Play a move (of either side) without searching, e.g. one
+		taken from the opening book.'''
+		self.position.make_move(self.to_position_move(move))
+		self.ponder_move = self.ponder_game_move = None
+		self.ponder_state = self.ponder_result = None
+
+	def ponder(self):
+		'''Search the position after the expected reply until
+		ponder_answer is called. Runs on the engine thread.'''
+		self.ponder_lock.acquire()
+		if self.ponder_move is None or self.ponder_state == "miss":
+			self.ponder_lock.release()
+			return
+		if self.ponder_state is None:
+			self.ponder_state = "pondering"
+		undo = self.position.make_move(self.ponder_move)
+		self.start_search(self.ponder_state == "pondering")
+		self.ponder_lock.release()
+
+		print "Pondering on", move_name(self.ponder_move)
+		best = self.iterate()
+		self.position.unmake_move(undo)
+		self.ponder_result = best
+
+	def ponder_answer(self, move):
+		'''Tell the engine the player's actual move (None if the game was
+		abandoned). If it was the expected one the pondering search goes on
+		as a normal search, with the time spent pondering counted in its
+		budget. Otherwise it is stopped. Called from the main thread.'''
+		self.ponder_lock.acquire()
+		if move is not None and self.ponder_state != "miss" and \
+			same_move(move, self.ponder_game_move):
+			self.ponder_state = "hit"
+			self.deadline = self.t_ini + self.max_time
+			self.node_limit = self.max_nodes
+		else:
+			self.ponder_state = "miss"
+			self.stopped = True
+		self.ponder_lock.release()
+
+	def cancel_ponder(self):
+		'''Nothing to do: ponder_answer(None) already stopped the search.'''
+		return
+
+	def close(self):
+		return
+
+	def set_limits(self, limits):
+		'''Take the depth, node and time budgets from a SearchLimits.'''
+		self.max_depth = limits.depth or MAX_DEPTH
+		self.max_nodes = limits.nodes or sys.maxint
+		if limits.movetime:
+			self.max_time = limits.movetime / 1000.0
+
+	def stop(self):
+		'''End the current search (called from another thread).'''
+		self.stopped = True
+
+	def new_game(self):
+		'''Go back to the starting position. The transposition table is
+		kept, its entries are still valid.'''
+		self.position = from_fen(START_FEN)
+		self.ponder_move = self.ponder_game_move = None
+		self.ponder_state = self.ponder_result = None
+
+	def is_alive(self):
+		return True
+
+	def to_position_move(self, move):
+		'''Translate a Move or Crowning object into a legal Position move.'''
+		frm = square(move.from_r, move.from_c)
+		to = square(move.to_r, move.to_c)
+		promo = QUEEN
+		if move.type == "Crowning":
+			promo = PIECE_CODES[move.piece]
+		for candidate in self.position.legal_moves_from(frm):
+			if candidate[1] == to and candidate[2] in (None, promo):
+				return candidate
+		raise Exception("Illegal move")
+
+	def to_game_move(self, move):
+		'''Translate a Position move into a Move or Crowning object.'''
+		return to_game_move(move)
+
+	def search(self, position = None):
+		'''Find the best move for the side to move.'''
+		if position is not None:
+			self.position = position
+		self.start_search()
+		return self.iterate()
+
+	def start_search(self, unlimited = False):
+		'''Reset the search state and budget. An unlimited search only
+		ends at max_depth or when stopped.'''
+		self.nodes = 0
+		self.stopped = False
+		self.killers = [[None, None] for ply in range(64)]
+		self.t_ini = time.time()
+		if unlimited:
+			self.deadline = float("inf")
+			self.node_limit = sys.maxint
+		else:
+			self.deadline = self.t_ini + self.max_time
+			self.node_limit = self.max_nodes
+
+	def iterate(self):
+		'''Iterative deepening from the current position.'''
+		t_ini = self.t_ini
+		best = None
+		for depth in range(1, self.max_depth + 1):
+			score, move = self.search_root(depth, best)
+			if self.stopped and best is not None:
+				break
+			if move is not None:
+				best = move
+				self.depth = depth
+			elapsed = time.time() - t_ini
+			print "depth %d score %d nodes %d nps %.0f pv %s" % (depth, score, \
+				self.nodes, self.nodes / max(elapsed, 1e-6), \
+				move and move_name(move))
+			if self.stopped or abs(score) >= MATE - 100:
+				break
+
+		self.elapsed = time.time() - t_ini
+		stats = self.tt.stats()
+		print "hash: %.1f%% hits, %.1f%% full, %d collisions" % \
+			(100 * stats["hit_rate"], 100 * stats["fill"], stats["collisions"])
+		return best
+
+	def search_root(self, depth, first):
+		position = self.position
+		moves = self.order_moves(list(position.legal_moves()), first, 0)
+		alpha, best = -INFINITY, None
+		for move in moves:
+			undo = position.make_move(move)
+			score = -self.alphabeta(depth - 1, -INFINITY, -alpha, 1)
+			position.unmake_move(undo)
+			if self.stopped:
+				break
+			if score > alpha or best is None:
+				alpha, best = score, move
+		if not self.stopped and best is not None:
+			self.tt.store(position.hash, depth, alpha, EXACT, best)
+		return alpha, best
+
+	def alphabeta(self, depth, alpha, beta, ply):
+		if depth <= 0:
+			return self.quiesce(alpha, beta, ply)
+
+		self.nodes += 1
+		if self.nodes & 1023 == 0:
+			self.check_budget()
+		if self.stopped:
+			return 0
+
+		position = self.position
+		key = position.hash
+		tt_move = None
+		entry = self.tt.probe(key)
+		if entry is not None:
+			tt_depth, tt_score, bound, tt_move = entry
+			if tt_depth >= depth:
+				tt_score = score_from_tt(tt_score, ply)
+				if bound == EXACT:
+					return tt_score
+				if bound == LOWER and tt_score >= beta:
+					return beta
+				if bound == UPPER and tt_score <= alpha:
+					return alpha
+
+		moves = list(position.legal_moves())
+		if not moves:
+			if position.in_check(position.turn):
+				return -MATE + ply
+			return 0
+
+		best, bound = None, UPPER
+		for move in self.order_moves(moves, tt_move, ply):
+			undo = position.make_move(move)
+			score = -self.alphabeta(depth - 1, -beta, -alpha, ply + 1)
+			position.unmake_move(undo)
+			if self.stopped:
+				return 0
+			if score >= beta:
+				if not position.mailbox[move[1]]:
+					killers = self.killers[ply]
+					if killers[0] != move:
+						killers[1] = killers[0]
+						killers[0] = move
+				self.tt.store(key, depth, score_to_tt(beta, ply), LOWER, move)
+				return beta
+			if score > alpha:
+				alpha, best, bound = score, move, EXACT
+		self.tt.store(key, depth, score_to_tt(alpha, ply), bound, best)
+		return alpha
+
+	def quiesce(self, alpha, beta, ply):
+		self.nodes += 1
+		if self.nodes & 1023 == 0:
+			self.check_budget()
+		if self.stopped:
+			return 0
+
+		position = self.position
+		stand_pat = evaluate(position)
+		if stand_pat >= beta:
+			return beta
+		if stand_pat > alpha:
+			alpha = stand_pat
+
+		mailbox = position.mailbox
+		captures = [move for move in position.legal_moves() \
+				if mailbox[move[1]] or move[2] == QUEEN]
+		for move in self.order_moves(captures, None, None):
+			undo = position.make_move(move)
+			score = -self.quiesce(-beta, -alpha, ply + 1)
+			position.unmake_move(undo)
+			if self.stopped:
+				return 0
+			if score >= beta:
+				return beta
+			if score > alpha:
+				alpha = score
+		return alpha
+
+	def order_moves(self, moves, first, ply):
+		'''Sort moves so the most promising ones are searched first.'''
+		mailbox = self.position.mailbox
+		killers = ply is not None and ply < 64 and self.killers[ply] or ()
+		def key(move):
+			if move == first:
+				return -INFINITY
+			victim = mailbox[move[1]]
+			if victim:
+				return -10 * PIECE_VALUES[victim & 7] + \
+					PIECE_VALUES[mailbox[move[0]] & 7] / 100
+			if move[2]:
+				return -PIECE_VALUES[move[2]]
+			if move in killers:
+				return 0
+			return 1
+		moves.sort(key = key)
+		return moves
+
+	def check_budget(self):
+		if self.nodes >= self.node_limit or time.time() >= self.deadline:
+			self.stopped = True
+
+def same_move(a, b):
+	'''Whether two Move/Crowning objects are the same move.'''
+	if a is None or b is None:
+		return False
+	return game_move_to_code(a) == game_move_to_code(b)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Analyse many positions in parallel with one engine process per core.
+
+	python analysispool.py [-d depth] [-n engines] ~/.cchess/*.log
+'''
+import sys, threading, Queue, multiprocessing
+from optparse import OptionParser
+from bitboard import *
+from chessengine import GnuChess
+
+class AnalysisResult:
+	'''Evaluation of one position: best move (a Move or Crowning, None
+	if the game is over), score in centipawns for the side to move and
+	depth reached. notation is the move in the engine's notation, such 
+	as "e2e4". error holds the exception if the analysis failed.'''
+	def __init__(self, index, fen, move = None, score = None, depth = 0,
+			error = None, notation = None):
+		self.index = index
+		self.fen = fen
+		self.move = move
+		self.notation = notation
+		self.score = score
+		self.depth = depth
+		self.error = error
+
+class EngineAnalysisPool:
+	'''Run size engine processes (one per core by default), each driven
+	by its own thread and pipe. Batches of positions are shared among
+	them and results are returned as soon as each one is ready.'''
+
+	def __init__(self, size = None, depth = 6, engine_class = GnuChess):
+		if size is None:
+			size = multiprocessing.cpu_count()
+		self.depth = depth
+		self.engine_class = engine_class
+		self.jobs = Queue.Queue()
+		self.workers = []
+		for i in range(size):
+			worker = threading.Thread(target = self.run, args = (engine_class(),))
+			worker.setDaemon(True)
+			worker.start()
+			self.workers.append(worker)
+
+	def analyse(self, positions):
+		'''Analyse a list of FEN strings. Yields an AnalysisResult per
+		position, in the order they finish.'''
+		results = Queue.Queue()
+		for index, fen in enumerate(positions):
+			self.jobs.put((index, fen, results))
+		for i in range(len(positions)):
+			yield results.get()
+
+	def analyse_all(self, positions):
+		'''Analyse a list of FEN strings and return the results in the
+		same order.'''
+		results = [None] * len(positions)
+		for result in self.analyse(positions):
+			results[result.index] = result
+		return results
+
+	def close(self):
+		for worker in self.workers:
+			self.jobs.put(None)
+		for worker in self.workers:
+			worker.join()
+
+	def run(self, engine):
+		while True:
+			job = self.jobs.get()
+			if job is None:
+				engine.close()
+				return
+			index, fen, results = job
+			try:
+				move, score, depth = engine.analyse(fen, self.depth)
+				notation = move and engine.move_to_gnuchess(move)
+				results.put(AnalysisResult(index, fen, move, score, depth,
+						notation = notation))
+			except Exception, ex:
+				results.put(AnalysisResult(index, fen, error = ex))
+				if not engine.is_alive():
+					print "Analysis engine died, restarting it"
+					engine = self.engine_class()
+
+def positions_from_log(path):
+	'''Replay a game log (as written by BoardController) and return the
+	FEN of the position before each move.'''
+	position = from_fen(START_FEN)
+	positions = []
+	for line in open(path):
+		#Moves look like "white: 4,6 to 4,4"
+		fields = line.replace(",", " ").split()
+		if len(fields) != 6 or fields[0] not in ("white:", "black:") or \
+			fields[3] != "to":
+			continue
+		frm = square(int(fields[1]), int(fields[2]))
+		to = square(int(fields[4]), int(fields[5]))
+		for move in position.legal_moves_from(frm):
+			if move[1] == to and move[2] in (None, QUEEN):
+				positions.append(position.fen())
+				position.make_move(move)
+				break
+		else:
+			print "%s: cannot replay %s" % (path, line.strip())
+			break
+	return positions
+
+def main():
+	parser = OptionParser(usage = "%prog [options] game.log...")
+	parser.add_option("-d", "--depth", type = "int", default = 6,
+		help = "search depth (default: 6)")
+	parser.add_option("-n", "--engines", type = "int", default = None,
+		help = "engine processes (default: one per core)")
+	options, args = parser.parse_args()
+
+	pool = EngineAnalysisPool(options.engines, options.depth)
+	for path in args:
+		positions = positions_from_log(path)
+		print "%s: %d positions" % (path, len(positions))
+		for result in pool.analyse_all(positions):
+			if result.error is not None:
+				print "%3d %s error: %s" % (result.index, result.fen, result.error)
+			elif result.move is None:
+				print "%3d %s game over" % (result.index, result.fen)
+			else:
+				print "%3d %s %s %s (depth %d)" % (result.index, result.fen,
+					result.notation, result.score, result.depth)
+	pool.close()
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
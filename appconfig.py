@@ -23,6 +23,51 @@ class AppConfig(object):
 	# Add stuff here to be available during the game
 	
 	debug = False
+
+	# Number of positions whose legal moves and check/mate status are 
+	# kept in the board's position cache.
+	position_cache_size = 512
+
+	# Number of rendered text surfaces (menu options, messages, labels)
+	# kept by resourcemanager.text_manager.
+	text_cache_size = 64
+
+	# CPU opponent: "gnuchess" for the bundled GNU Chess, "uci" or 
+	# "xboard" for an installed engine started with engine_command, or 
+	# "builtin" for the in-process alpha-beta engine. The built-in engine
+	# is also used when the selected one cannot be started.
+	engine = "gnuchess"
+	engine_command = "stockfish"
+
+	# CPU strength: "Beginner", "Easy", "Medium", "Hard" or "Expert" (see 
+	# timecontrol.LEVELS). It can be changed from the menu.
+	strength = "Medium"
+
+	# Hard cap on the engine's thinking time per move, in milliseconds.
+	# Lower it on slow machines.
+	max_think_ms = 10000
+
+	# Answer opening moves from data/book.bin instead of the engine.
+	opening_book = True
+
+	# Play endings with up to 4 pieces perfectly from the tables in
+	# data/tb (see tablebase.py).
+	tablebases = True
+
+	# Highlight the cells attacked by the opponent of the side to move.
+	# Toggled with the "t" key.
+	show_threats = False
+
+	# Let the engine think while the player does (pondering).
+	ponder = True
+
+	# Game clock for CPU games: base time and increment per move, in 
+	# milliseconds.
+	clock_base_ms = 15 * 60 * 1000
+	clock_increment_ms = 2000
+
+	# Memory for the built-in engine's transposition table, in megabytes.
+	hash_size_mb = 2
 	
 	def __call__(self):
 		return self
@@ -0,0 +1,81 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Attack maps: how many pieces of each side attack each square of a
+Position, as 8x8 tables indexed [i][j] like Board cells.
+
+The maps are computed in one go for the whole board. When NumPy is
+available the attack bitboards of all the pieces of a side are
+expanded into bits and added up as arrays; otherwise the same counts
+are built in plain Python. Either way, once a map is built every 
+query is a table lookup.'''
+from bitboard import *
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+if numpy is not None:
+	_SHIFTS = numpy.arange(64, dtype = numpy.uint64)
+	_ONE = numpy.uint64(1)
+
+def attack_counts(boards):
+	'''Add up attack bitboards into an 8x8 table of counts, indexed
+	[i][j].'''
+	if numpy is not None:
+		if not boards:
+			return numpy.zeros((8, 8), dtype = int)
+		boards = numpy.array(boards, dtype = numpy.uint64)
+		bits = (boards[:, numpy.newaxis] >> _SHIFTS) & _ONE
+		#Square numbers are j*8 + i: the sums come out by row
+		return bits.sum(axis = 0).astype(int).reshape(8, 8).T
+	counts = [[0] * 8 for i in range(8)]
+	for board in boards:
+		for sq in iter_squares(board):
+			counts[sq & 7][sq >> 3] += 1
+	return counts
+
+class AttackMap:
+	'''Attackers of every square for both sides of a Position. Build a
+	new one when the position changes (see Board.attack_map).'''
+	def __init__(self, position):
+		self.counts = []
+		for color in (WHITE, BLACK):
+			boards = [position.piece_attacks(sq) for sq in \
+					iter_squares(position.occupied[color])]
+			self.counts.append(attack_counts(boards))
+
+	def attackers(self, color, i, j):
+		'''Number of color's pieces attacking cell (i, j).'''
+		return self.counts[color][i][j]
+
+	def is_attacked(self, color, i, j):
+		'''Whether any of color's pieces attacks cell (i, j).'''
+		return self.counts[color][i][j] > 0
+
+	def attacked_cells(self, color):
+		'''The (i, j) cells attacked by color, with their number of
+		attackers, as a dictionary.'''
+		counts = self.counts[color]
+		cells = {}
+		for i in range(0, 8):
+			for j in range(0, 8):
+				if counts[i][j]:
+					cells[(i, j)] = int(counts[i][j])
+		return cells
@@ -0,0 +1,691 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Bitboard based move generation core.
+
+Squares are numbered 0..63 as j*8 + i, using the same (i, j) cell
+coordinates as Board: i is the column (0 is the "a" file) and j is the
+row (0 is the top row, where black starts). So a8 is 0 and h1 is 63.
+
+This module does not depend on pygame, so it can be used headless.'''
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+
+COLOR_NAMES = ("white", "black")
+PIECE_NAMES = (None, "pawn", "knight", "bishop", "rook", "queen", "king")
+COLOR_CODES = {"white" : WHITE, "black" : BLACK}
+PIECE_CODES = {"pawn" : PAWN, "knight" : KNIGHT, "bishop" : BISHOP,
+		"rook" : ROOK, "queen" : QUEEN, "king" : KING}
+
+#Castling rights bits:
+WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO = 1, 2, 4, 8
+ALL_CASTLING = 15
+
+def square(i, j):
+	'''Convert cell coordinates to a square number'''
+	return j * 8 + i
+
+def coords(sq):
+	'''Convert a square number to cell coordinates'''
+	return (sq & 7, sq >> 3)
+
+def lsb(b):
+	'''Index of the lowest set bit of b'''
+	return (b & -b).bit_length() - 1
+
+def msb(b):
+	'''Index of the highest set bit of b'''
+	return b.bit_length() - 1
+
+def iter_squares(b):
+	'''Yield the square numbers of all bits set in b'''
+	while b:
+		low = b & -b
+		yield low.bit_length() - 1
+		b ^= low
+
+def count_bits(b):
+	return bin(b).count("1")
+
+FILES = "abcdefgh"
+PIECE_CHARS = " pnbrqk"
+
+def square_name(sq):
+	'''Algebraic name of a square, such as "e4"'''
+	return FILES[sq & 7] + str(8 - (sq >> 3))
+
+def parse_square(name):
+	return square(FILES.index(name[0]), 8 - int(name[1]))
+
+def move_name(move):
+	'''Coordinate notation for a move, such as "e2e4" or "e7e8q"'''
+	frm, to, promo = move
+	name = square_name(frm) + square_name(to)
+	if promo:
+		name += PIECE_CHARS[promo]
+	return name
+
+#Precomputed tables:
+def _build_leaper(deltas):
+	table = []
+	for sq in range(64):
+		i, j = coords(sq)
+		b = 0
+		for di, dj in deltas:
+			if 0 <= i + di < 8 and 0 <= j + dj < 8:
+				b |= 1 << square(i + di, j + dj)
+		table.append(b)
+	return table
+
+def _build_ray(di, dj):
+	table = []
+	for sq in range(64):
+		i, j = coords(sq)
+		b = 0
+		i, j = i + di, j + dj
+		while 0 <= i < 8 and 0 <= j < 8:
+			b |= 1 << square(i, j)
+			i, j = i + di, j + dj
+		table.append(b)
+	return table
+
+KNIGHT_ATTACKS = _build_leaper([(1, 2), (2, 1), (2, -1), (1, -2),
+				(-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _build_leaper([(1, 0), (1, 1), (0, 1), (-1, 1),
+				(-1, 0), (-1, -1), (0, -1), (1, -1)])
+#Squares attacked by a pawn of each color (white moves up, towards j=0)
+PAWN_ATTACKS = (_build_leaper([(-1, -1), (1, -1)]),
+		_build_leaper([(-1, 1), (1, 1)]))
+
+#Rays going towards higher square numbers are blocked by their lowest
+#set bit, the others by their highest set bit.
+ROOK_RAYS_UP = (_build_ray(1, 0), _build_ray(0, 1))
+ROOK_RAYS_DOWN = (_build_ray(-1, 0), _build_ray(0, -1))
+BISHOP_RAYS_UP = (_build_ray(1, 1), _build_ray(-1, 1))
+BISHOP_RAYS_DOWN = (_build_ray(-1, -1), _build_ray(1, -1))
+
+def _slide(sq, occ, rays_up, rays_down):
+	attacks = 0
+	for ray in rays_up:
+		r = ray[sq]
+		blockers = r & occ
+		if blockers:
+			r ^= ray[(blockers & -blockers).bit_length() - 1]
+		attacks |= r
+	for ray in rays_down:
+		r = ray[sq]
+		blockers = r & occ
+		if blockers:
+			r ^= ray[blockers.bit_length() - 1]
+		attacks |= r
+	return attacks
+
+def rook_attacks(sq, occ):
+	'''Squares attacked by a rook on sq, given the occupancy occ'''
+	return _slide(sq, occ, ROOK_RAYS_UP, ROOK_RAYS_DOWN)
+
+def bishop_attacks(sq, occ):
+	'''Squares attacked by a bishop on sq, given the occupancy occ'''
+	return _slide(sq, occ, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
+
+def queen_attacks(sq, occ):
+	return _slide(sq, occ, ROOK_RAYS_UP, ROOK_RAYS_DOWN) | \
+		_slide(sq, occ, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
+
+ROOK_EMPTY_ATTACKS = [rook_attacks(sq, 0) for sq in range(64)]
+BISHOP_EMPTY_ATTACKS = [bishop_attacks(sq, 0) for sq in range(64)]
+
+def _build_lines():
+	between = [0] * 4096
+	line = [0] * 4096
+	for ray, back in zip(ROOK_RAYS_UP + BISHOP_RAYS_UP + ROOK_RAYS_DOWN +
+			BISHOP_RAYS_DOWN, ROOK_RAYS_DOWN + BISHOP_RAYS_DOWN +
+			ROOK_RAYS_UP + BISHOP_RAYS_UP):
+		for a in range(64):
+			full = ray[a] | back[a] | (1 << a)
+			for b in iter_squares(ray[a]):
+				between[a * 64 + b] = ray[a] & ~ray[b] & ~(1 << b)
+				line[a * 64 + b] = full
+	return between, line
+
+#BETWEEN[a*64+b]: squares strictly between two aligned squares.
+#LINE[a*64+b]: the whole line through two aligned squares. Both are 0 
+#for squares that are not on a common rank, file or diagonal.
+BETWEEN, LINE = _build_lines()
+
+#Castling: (right, king from, king to, rook from, rook to, empty squares,
+#squares the king crosses)
+CASTLINGS = (
+	(WHITE_OO, 60, 62, 63, 61, (1 << 61) | (1 << 62), (61, 62)),
+	(WHITE_OOO, 60, 58, 56, 59, (1 << 57) | (1 << 58) | (1 << 59), (59, 58)),
+	(BLACK_OO, 4, 6, 7, 5, (1 << 5) | (1 << 6), (5, 6)),
+	(BLACK_OOO, 4, 2, 0, 3, (1 << 1) | (1 << 2) | (1 << 3), (3, 2)),
+)
+
+#Castling rights kept after a move touches a square:
+CASTLING_MASK = [ALL_CASTLING] * 64
+CASTLING_MASK[60] = ALL_CASTLING & ~(WHITE_OO | WHITE_OOO)
+CASTLING_MASK[63] = ALL_CASTLING & ~WHITE_OO
+CASTLING_MASK[56] = ALL_CASTLING & ~WHITE_OOO
+CASTLING_MASK[4] = ALL_CASTLING & ~(BLACK_OO | BLACK_OOO)
+CASTLING_MASK[7] = ALL_CASTLING & ~BLACK_OO
+CASTLING_MASK[0] = ALL_CASTLING & ~BLACK_OOO
+
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+#Zobrist keys. A fixed seed keeps keys (and anything stored by key, such
+#as opening books) stable between runs.
+def _build_zobrist():
+	import random
+	rand = random.Random(0x43454942)
+	pieces = [0] * (15 * 64)
+	for code in range(15):
+		if code & 7 in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+			for sq in range(64):
+				pieces[code * 64 + sq] = rand.getrandbits(64)
+	castling = [rand.getrandbits(64) for rights in range(16)]
+	castling[0] = 0
+	ep_files = [rand.getrandbits(64) for i in range(8)]
+	return pieces, castling, ep_files, rand.getrandbits(64)
+
+#ZOBRIST_PIECES is indexed by mailbox code * 64 + square
+ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_EP, ZOBRIST_BLACK = _build_zobrist()
+
+
+class Position:
+	'''A chess position stored as 12 piece bitboards (pieces[color][type])
+	plus one occupancy bitboard per side. A 64 entry mailbox mirrors the
+	bitboards so the piece on a given square can be found in O(1).
+	Mailbox entries are (color << 3) | type, or 0 for an empty square.
+
+	Moves are (from, to, promotion) tuples, promotion being None for
+	non-promoting moves.'''
+
+	def __init__(self):
+		self.pieces = [[0] * 7, [0] * 7]
+		self.occupied = [0, 0]
+		self.mailbox = [0] * 64
+		self.turn = WHITE
+		self.castling = ALL_CASTLING
+		#En passant target square (the square a pawn skipped over)
+		self.ep = None
+		#Zobrist key, kept up to date by every method changing the position
+		self.hash = ZOBRIST_CASTLING[ALL_CASTLING]
+
+	def copy(self):
+		clone = Position()
+		clone.pieces = [self.pieces[0][:], self.pieces[1][:]]
+		clone.occupied = self.occupied[:]
+		clone.mailbox = self.mailbox[:]
+		clone.turn = self.turn
+		clone.castling = self.castling
+		clone.ep = self.ep
+		clone.hash = self.hash
+		return clone
+
+	def compute_hash(self):
+		'''Compute the Zobrist key from scratch.'''
+		key = ZOBRIST_CASTLING[self.castling]
+		for sq in range(64):
+			if self.mailbox[sq]:
+				key ^= ZOBRIST_PIECES[self.mailbox[sq] * 64 + sq]
+		if self.ep is not None:
+			key ^= ZOBRIST_EP[self.ep & 7]
+		if self.turn == BLACK:
+			key ^= ZOBRIST_BLACK
+		return key
+
+	def rehash(self):
+		'''Recompute the key after turn, castling or ep were assigned
+		directly.'''
+		self.hash = self.compute_hash()
+
+	def set_turn(self, color):
+		if color != self.turn:
+			self.turn = color
+			self.hash ^= ZOBRIST_BLACK
+
+	def set_fen(self, fen):
+		'''Set up the position described by a FEN string.'''
+		fields = fen.split()
+		self.__init__()
+		sq = 0
+		for char in fields[0]:
+			if char == "/":
+				continue
+			if char.isdigit():
+				sq += int(char)
+				continue
+			color = BLACK
+			if char.isupper():
+				color = WHITE
+			self.put(sq, color, PIECE_CHARS.index(char.lower()))
+			sq += 1
+
+		self.turn = len(fields) > 1 and fields[1] == "b" and BLACK or WHITE
+		self.castling = 0
+		if len(fields) > 2:
+			for char, right in zip("KQkq", (WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO)):
+				if char in fields[2]:
+					self.castling |= right
+		#Like make_move, keep the en passant square only if a pawn can
+		#take there, or the same position would get two keys
+		if len(fields) > 3 and fields[3] != "-":
+			ep = parse_square(fields[3])
+			if PAWN_ATTACKS[self.turn ^ 1][ep] & self.pieces[self.turn][PAWN]:
+				self.ep = ep
+		self.rehash()
+
+	def fen(self):
+		'''Describe this position as a FEN string.'''
+		rows = []
+		for j in range(8):
+			row, empty = "", 0
+			for i in range(8):
+				code = self.mailbox[square(i, j)]
+				if not code:
+					empty += 1
+					continue
+				if empty:
+					row, empty = row + str(empty), 0
+				char = PIECE_CHARS[code & 7]
+				row += code >> 3 == WHITE and char.upper() or char
+			if empty:
+				row += str(empty)
+			rows.append(row)
+
+		castling = "".join([char for char, right in zip("KQkq", 
+			(WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO)) if self.castling & right])
+		return "%s %s %s %s 0 1" % ("/".join(rows), "wb"[self.turn],
+			castling or "-", self.ep is None and "-" or square_name(self.ep))
+
+	def put(self, sq, color, ptype):
+		'''Place a piece on sq, replacing whatever was there.'''
+		if self.mailbox[sq]:
+			self.remove(sq)
+		bit = 1 << sq
+		self.pieces[color][ptype] |= bit
+		self.occupied[color] |= bit
+		self.mailbox[sq] = (color << 3) | ptype
+		self.hash ^= ZOBRIST_PIECES[((color << 3) | ptype) * 64 + sq]
+
+	def remove(self, sq):
+		'''Remove the piece on sq, if any.'''
+		code = self.mailbox[sq]
+		if not code:
+			return
+		color = code >> 3
+		bit = 1 << sq
+		self.pieces[color][code & 7] &= ~bit
+		self.occupied[color] &= ~bit
+		self.mailbox[sq] = 0
+		self.hash ^= ZOBRIST_PIECES[code * 64 + sq]
+
+	def piece_at(self, sq):
+		'''Return (color, type) for the piece on sq or None.'''
+		code = self.mailbox[sq]
+		if not code:
+			return None
+		return (code >> 3, code & 7)
+
+	def king_square(self, color):
+		king = self.pieces[color][KING]
+		if not king:
+			raise Exception("Error: " + COLOR_NAMES[color] + " king not found!!")
+		return lsb(king)
+
+	def attackers_to(self, sq, color, occ = None):
+		'''Bitboard of color's pieces attacking sq.'''
+		if occ is None:
+			occ = self.occupied[0] | self.occupied[1]
+		pieces = self.pieces[color]
+		return (PAWN_ATTACKS[color ^ 1][sq] & pieces[PAWN]) | \
+			(KNIGHT_ATTACKS[sq] & pieces[KNIGHT]) | \
+			(KING_ATTACKS[sq] & pieces[KING]) | \
+			(bishop_attacks(sq, occ) & (pieces[BISHOP] | pieces[QUEEN])) | \
+			(rook_attacks(sq, occ) & (pieces[ROOK] | pieces[QUEEN]))
+
+	def is_attacked(self, sq, color):
+		'''Whether sq is attacked by any of color's pieces.'''
+		pieces = self.pieces[color]
+		if PAWN_ATTACKS[color ^ 1][sq] & pieces[PAWN] or \
+			KNIGHT_ATTACKS[sq] & pieces[KNIGHT] or \
+			KING_ATTACKS[sq] & pieces[KING]:
+			return True
+		occ = self.occupied[0] | self.occupied[1]
+		queens = pieces[QUEEN]
+		if (pieces[BISHOP] | queens) and \
+			bishop_attacks(sq, occ) & (pieces[BISHOP] | queens):
+			return True
+		if (pieces[ROOK] | queens) and \
+			rook_attacks(sq, occ) & (pieces[ROOK] | queens):
+			return True
+		return False
+
+	def in_check(self, color):
+		'''Whether color's king is attacked.'''
+		king = self.pieces[color][KING]
+		if not king:
+			return False
+		return self.is_attacked(lsb(king), color ^ 1)
+
+	def piece_attacks(self, sq):
+		'''Squares attacked by the piece on sq.'''
+		code = self.mailbox[sq]
+		ptype = code & 7
+		if ptype == PAWN:
+			return PAWN_ATTACKS[code >> 3][sq]
+		if ptype == KNIGHT:
+			return KNIGHT_ATTACKS[sq]
+		if ptype == KING:
+			return KING_ATTACKS[sq]
+		occ = self.occupied[0] | self.occupied[1]
+		if ptype == BISHOP:
+			return bishop_attacks(sq, occ)
+		if ptype == ROOK:
+			return rook_attacks(sq, occ)
+		if ptype == QUEEN:
+			return queen_attacks(sq, occ)
+		return 0
+
+	def attacks(self, color):
+		'''All squares attacked by color's pieces.'''
+		pieces = self.pieces[color]
+		occ = self.occupied[0] | self.occupied[1]
+		result = 0
+		pawns = pieces[PAWN]
+		if color == WHITE:
+			result |= ((pawns & ~_FILE_A) >> 9) | ((pawns & ~_FILE_H) >> 7)
+		else:
+			result |= ((pawns & ~_FILE_H) << 9) | ((pawns & ~_FILE_A) << 7)
+		for sq in iter_squares(pieces[KNIGHT]):
+			result |= KNIGHT_ATTACKS[sq]
+		for sq in iter_squares(pieces[BISHOP] | pieces[QUEEN]):
+			result |= bishop_attacks(sq, occ)
+		for sq in iter_squares(pieces[ROOK] | pieces[QUEEN]):
+			result |= rook_attacks(sq, occ)
+		for sq in iter_squares(pieces[KING]):
+			result |= KING_ATTACKS[sq]
+		return result & _ALL_SQUARES
+
+	def generate_moves(self, color = None):
+		'''Yield all pseudo-legal moves for color (defaults to the side
+		to move). Moves may leave the own king in check.'''
+		if color is None:
+			color = self.turn
+		pieces = self.pieces[color]
+		for ptype in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+			for sq in iter_squares(pieces[ptype]):
+				for move in self.moves_from(sq):
+					yield move
+
+	def moves_from(self, sq):
+		'''Yield the pseudo-legal moves of the piece on sq.'''
+		code = self.mailbox[sq]
+		if not code:
+			return
+		color, ptype = code >> 3, code & 7
+		own = self.occupied[color]
+		enemy = self.occupied[color ^ 1]
+
+		if ptype == PAWN:
+			for move in self._pawn_moves(sq, color, own | enemy, enemy):
+				yield move
+			return
+
+		if ptype == KNIGHT:
+			targets = KNIGHT_ATTACKS[sq]
+		elif ptype == KING:
+			targets = KING_ATTACKS[sq]
+		elif ptype == BISHOP:
+			targets = bishop_attacks(sq, own | enemy)
+		elif ptype == ROOK:
+			targets = rook_attacks(sq, own | enemy)
+		else:
+			targets = queen_attacks(sq, own | enemy)
+
+		targets &= ~own
+		while targets:
+			low = targets & -targets
+			yield (sq, low.bit_length() - 1, None)
+			targets ^= low
+
+		if ptype == KING and self.castling:
+			for move in self._castling_moves(sq, color):
+				yield move
+
+	def _pawn_moves(self, sq, color, occ, enemy):
+		if color == WHITE:
+			step, start_row, last_row, ep_row = -8, 6, 0, 2
+		else:
+			step, start_row, last_row, ep_row = 8, 1, 7, 5
+		row = sq >> 3
+		dests = []
+		to = sq + step
+		if not (occ >> to) & 1:
+			dests.append(to)
+			if row == start_row and not (occ >> (to + step)) & 1:
+				dests.append(to + step)
+		captures = PAWN_ATTACKS[color][sq]
+		if self.ep is not None and (self.ep >> 3) == ep_row:
+			enemy |= 1 << self.ep
+		for to in iter_squares(captures & enemy):
+			dests.append(to)
+		for to in dests:
+			if to >> 3 == last_row:
+				for promo in PROMOTIONS:
+					yield (sq, to, promo)
+			else:
+				yield (sq, to, None)
+
+	def _castling_moves(self, sq, color):
+		occ = self.occupied[0] | self.occupied[1]
+		rook = (color << 3) | ROOK
+		checked = None
+		for right, kfrom, kto, rfrom, rto, empty, path in CASTLINGS:
+			if not self.castling & right or sq != kfrom or \
+				self.mailbox[rfrom] != rook or occ & empty:
+				continue
+			if checked is None:
+				checked = self.is_attacked(sq, color ^ 1)
+			if checked:
+				return
+			if self.is_attacked(path[0], color ^ 1) or \
+				self.is_attacked(path[1], color ^ 1):
+				continue
+			yield (kfrom, kto, None)
+
+	def legal_moves(self, color = None):
+		'''Yield all legal moves for color (defaults to the side to 
+		move). Checkers and pinned pieces are computed once, so no move
+		needs to be played to find out whether it is legal.'''
+		if color is None:
+			color = self.turn
+		if not self.pieces[color][KING]:
+			return
+		info = self._legality(color)
+		own = self.occupied[color]
+		king = self.pieces[color][KING]
+		#King moves first: they are the only ones in a double check
+		for move in self._legal_from(lsb(king), color, info):
+			yield move
+		if info[2] == 0:
+			return
+		for sq in iter_squares(own & ~king):
+			for move in self._legal_from(sq, color, info):
+				yield move
+
+	def legal_moves_from(self, sq):
+		'''Yield the legal moves of the piece on sq.'''
+		code = self.mailbox[sq]
+		if not code or not self.pieces[code >> 3][KING]:
+			return
+		color = code >> 3
+		for move in self._legal_from(sq, color, self._legality(color)):
+			yield move
+
+	def has_legal_moves(self, color = None):
+		for move in self.legal_moves(color):
+			return True
+		return False
+
+	def _legality(self, color):
+		'''Compute (king square, checkers, evasion mask, pins) for color.
+		The evasion mask holds the squares non-king moves must land on
+		(everything when not in check, nothing in a double check) and pins
+		maps each pinned piece's square to the line it must stay on.'''
+		them = color ^ 1
+		ksq = lsb(self.pieces[color][KING])
+		occ = self.occupied[0] | self.occupied[1]
+		checkers = self.attackers_to(ksq, them, occ)
+
+		if not checkers:
+			evasion = _ALL_SQUARES
+		elif checkers & (checkers - 1):
+			evasion = 0
+		else:
+			evasion = checkers | BETWEEN[ksq * 64 + lsb(checkers)]
+
+		pins = {}
+		enemy = self.pieces[them]
+		snipers = (ROOK_EMPTY_ATTACKS[ksq] & (enemy[ROOK] | enemy[QUEEN])) | \
+			(BISHOP_EMPTY_ATTACKS[ksq] & (enemy[BISHOP] | enemy[QUEEN]))
+		own = self.occupied[color]
+		for sniper in iter_squares(snipers):
+			blockers = BETWEEN[ksq * 64 + sniper] & occ
+			if blockers and not blockers & (blockers - 1) and blockers & own:
+				pins[lsb(blockers)] = LINE[ksq * 64 + sniper]
+
+		return (ksq, checkers, evasion, pins)
+
+	def _legal_from(self, sq, color, info):
+		ksq, checkers, evasion, pins = info
+		code = self.mailbox[sq]
+		ptype = code & 7
+
+		if ptype == KING:
+			them = color ^ 1
+			occ = (self.occupied[0] | self.occupied[1]) & ~(1 << sq)
+			for move in self.moves_from(sq):
+				to = move[1]
+				#Castling moves are only generated when legal
+				if to - sq == 2 or sq - to == 2 or \
+					not self.attackers_to(to, them, occ):
+					yield move
+			return
+
+		mask = evasion
+		if sq in pins:
+			mask &= pins[sq]
+		ep = self.ep
+		for move in self.moves_from(sq):
+			to = move[1]
+			if ptype == PAWN and to == ep and (sq ^ to) & 7:
+				#En passant removes two pieces from a line, just try it:
+				undo = self.make_move(move)
+				checked = self.in_check(color)
+				self.unmake_move(undo)
+				if not checked:
+					yield move
+			elif (mask >> to) & 1:
+				yield move
+
+	def make_move(self, move):
+		'''Apply a pseudo-legal move and pass the turn to the opponent.
+		Returns an undo record that unmake_move uses to restore the 
+		position in place: (move, moved piece, captured piece, captured 
+		square, castling rights, en passant square, side to move, key).'''
+		frm, to, promo = move
+		mailbox = self.mailbox
+		code = mailbox[frm]
+		color, ptype = code >> 3, code & 7
+		them = color ^ 1
+
+		cap_sq = to
+		if not mailbox[to] and ptype == PAWN and to == self.ep and (frm ^ to) & 7:
+			cap_sq = to + 8 if color == WHITE else to - 8
+		captured = mailbox[cap_sq]
+		undo = (move, code, captured, cap_sq, self.castling, self.ep, self.turn,
+			self.hash)
+
+		if captured:
+			self.remove(cap_sq)
+		self.remove(frm)
+		self.put(to, color, promo or ptype)
+
+		if ptype == KING and (to - frm == 2 or frm - to == 2):
+			rfrom, rto = _CASTLING_ROOKS[to]
+			self.remove(rfrom)
+			self.put(rto, color, ROOK)
+
+		castling = self.castling & CASTLING_MASK[frm] & CASTLING_MASK[to]
+		if castling != self.castling:
+			self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+			self.castling = castling
+
+		if self.ep is not None:
+			self.hash ^= ZOBRIST_EP[self.ep & 7]
+			self.ep = None
+		if ptype == PAWN and (to - frm == 16 or frm - to == 16):
+			ep = (frm + to) >> 1
+			if PAWN_ATTACKS[color][ep] & self.pieces[them][PAWN]:
+				self.ep = ep
+				self.hash ^= ZOBRIST_EP[ep & 7]
+
+		if self.turn != them:
+			self.turn = them
+			self.hash ^= ZOBRIST_BLACK
+		return undo
+
+	def unmake_move(self, undo):
+		'''Take back the move recorded in undo (see make_move).'''
+		move, code, captured, cap_sq, castling, ep, turn, key = undo
+		frm, to, promo = move
+		color = code >> 3
+
+		self.remove(to)
+		self.put(frm, color, code & 7)
+		if captured:
+			self.put(cap_sq, captured >> 3, captured & 7)
+
+		if code & 7 == KING and (to - frm == 2 or frm - to == 2):
+			rfrom, rto = _CASTLING_ROOKS[to]
+			self.remove(rto)
+			self.put(rfrom, color, ROOK)
+
+		self.castling = castling
+		self.ep = ep
+		self.turn = turn
+		self.hash = key
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def from_fen(fen):
+	'''Create a new Position from a FEN string'''
+	position = Position()
+	position.set_fen(fen)
+	return position
+
+#Rook (from, to) squares by castling king destination:
+_CASTLING_ROOKS = dict((kto, (rfrom, rto)) for right, kfrom, kto, rfrom, rto,
+			empty, path in CASTLINGS)
+
+_ALL_SQUARES = (1 << 64) - 1
+_FILE_A = sum(1 << square(0, j) for j in range(8))
+_FILE_H = sum(1 << square(7, j) for j in range(8))
@@ -18,7 +18,32 @@
 #
 import os, time
 from cell import *
+from bitboard import *
+from lrucache import LRUCache
+from movecode import encode_move, decode_move, move_list
+from attackmap import AttackMap
+from appconfig import AppConfig
 from resourcemanager import image_manager
+from tablebase import tablebases
+
+class PositionInfo:
+	'''Legality information about a position, computed lazily: legal
+	moves per square (packed, see movecode, and as sets of codes for
+	membership tests), whether the side to move is in check, the game
+	status ("playing", "checkmate" or "stalemate") and
+	the AttackMap of both sides, only built for the threats overlay.'''
+	def __init__(self):
+		self.moves = {}
+		self.move_sets = {}
+		self.checked = None
+		self.attacks = None
+		self.status = None
+
+#Shared by all boards, keyed by Zobrist key:
+position_cache = LRUCache(AppConfig.position_cache_size)
+
+#Game statuses that end the game in a draw (see Board.game_status)
+DRAW_STATUSES = ("stalemate", "repetition", "fifty_moves")
 
 # Board class
 class Board:
@@ -26,34 +51,40 @@ class Board:
 	def __init__(self, width, height):
 		self.w, self.h = width, height
 		self.board = []
-		self.king_white_move = False
-		self.king_black_move = False
 
-		#Castling specific:
-		self.white_king_moved = False
-		self.white_tower_right_moved = False
-		self.white_tower_left_moved = False
+		#Mapping between cells and pixels, shared by rendering and
+		#picking: cell size, screen position of the board's top left
+		#corner and whether it is seen from black's side.
+		self.cell_size = width / 8
+		self.x, self.y = 0, 0
+		self.flipped = False
 
-		self.black_king_moved = False
-		self.black_tower_right_moved = False
-		self.black_tower_left_moved = False
+		#Rules state (piece placement, castling rights, en passant)
+		#lives in a bitboard Position. Cells mirror it for rendering.
+		#position.hash is the Zobrist key identifying the position.
+		self.position = Position()
 
 		self.current_turn = "white"
 		
-		#Special parameter hypothetical is used 
-		#to flag whether moves are being calculated for a hypothetical
-		#board (such as checking if the king is checked after moving to 
-		#some cell). This prevents an inifite recursion when checking
-		#a king's possible moves.
-		self.hypothetical = False
-		
-		self.moves_cache_dirty = True
-		self.all_moves = {"white" : [], "black" : []} 
-		
-		self.white_en_passant = None
-		self.black_en_passant = None
+		#Game history: Zobrist keys of the positions played, how many 
+		#times each one was seen since the last capture or pawn move and
+		#the number of halfmoves since then. See start_history.
+		self.hash_history = []
+		self.repetitions = {}
+		self.halfmove_clock = 0
+
+		#(i, j) of the cells whose piece changed since the last call to
+		#render, so only those need to be redrawn
+		self.dirty_cells = set()
 		
+		#Rendering layers: background (wood and squares, never changes),
+		#pieces (updated only for dirty_cells) and overlay (selection
+		#and move highlights). frame is their composition.
 		self.background = None
+		self.pieces_layer = None
+		self.overlay = None
+		self.overlay_highlights = {}
+		self.frame = None
 		for i in range(0, 8):
 			self.board.append([])
 			for j in range(0, 8):
@@ -62,60 +93,15 @@ class Board:
 				else:
 					color = (255, 255, 255)
 				self.board[i].append(Cell(i, j, width/8, color))
-		self.castling_allowed = ["white", "black"]
-	
-	def clone(self):
-		'''Create a shallow copy of this board. Cloned boards are
-		hypothetical by default.'''
-		clone = Board(self.w, self.h)
-		
-		clone.king_white_move = self.king_white_move
-		clone.king_black_move = self.king_black_move
-		
-		clone.white_king_moved = self.white_king_moved
-		clone.white_tower_right_moved = self.white_tower_right_moved
-		clone.white_tower_left_moved = self.white_tower_left_moved 
-
-		clone.black_king_moved = self.black_king_moved
-		clone.black_tower_right_moved = self.black_tower_right_moved
-		clone.black_tower_left_moved = self.black_tower_left_moved 
-		
-		clone.current_turn = self.current_turn
-		clone.hypothetical = True
-		
-		clone.white_en_passant = self.white_en_passant
-		clone.black_en_passant = self.black_en_passant
-		
-		for i in range(0,8):
-			for j in range(0,8):
-				piece = self[i][j].piece
-				if not piece:
-					continue
-				clone[i][j].piece = Piece(piece.type, piece.owner)
-				
-		clone.castling_allowed = self.castling_allowed
-		
-		return clone
 	
 	def reset(self):
 		'''Reset all game-specific flags'''
-		self.king_white_move = False
-		self.king_black_move = False
-
-		#Castling specific:
-		self.white_king_moved = False
-		self.white_tower_right_moved = False
-		self.white_tower_left_moved = False
-
-		self.black_king_moved = False
-		self.black_tower_right_moved = False
-		self.black_tower_left_moved = False
+		self.position.castling = ALL_CASTLING
+		self.position.ep = None
 
 		self.current_turn = "white"
-		
-		self.hypothetical = False
-
-		self.castling_allowed = ["white", "black"]
+		self.position.turn = WHITE
+		self.position.rehash()
 		
 
 	def __getitem__(self, i):
@@ -139,21 +125,105 @@ class Board:
 
 		surface.blit(self.background, self.background.get_rect())
 	
-	def render_foreground(self, surface):
-		'''Render cell contents. Call render_foreground on each cell.'''
-		for i in range(0, 8):
-			for j in range(0, 8):
-				self.board[i][j].render_foreground(surface)
+	def set_offset(self, x, y):
+		'''Set the screen position of the board's top left corner.'''
+		self.x, self.y = x, y
+
+	def flip(self):
+		'''Turn the board around, to see it from the other side.'''
+		self.flipped = not self.flipped
+		self.frame = None
+
+	def cell_origin(self, i, j):
+		'''Top left corner of cell (i, j) on the board surface.'''
+		size = self.cell_size
+		if self.flipped:
+			return (7 - i) * size, (7 - j) * size
+		return i * size, j * size
+
+	def cell_rect(self, i, j):
+		'''Area of cell (i, j) on the board surface.'''
+		x, y = self.cell_origin(i, j)
+		return pygame.Rect(x, y, self.cell_size, self.cell_size)
+
+	def screen_rect(self, i, j):
+		'''Area of cell (i, j) on the screen.'''
+		return self.cell_rect(i, j).move(self.x, self.y)
+
+	def cell_at(self, x, y):
+		'''Indices (i, j) of the cell below the x,y screen position, or
+		None if it is off the board.'''
+		x, y = x - self.x, y - self.y
+		if x < 0 or y < 0:
+			return None
+		i, j = x / self.cell_size, y / self.cell_size
+		if i > 7 or j > 7:
+			return None
+		if self.flipped:
+			return 7 - i, 7 - j
+		return i, j
+
+	def render(self, surface, highlights = {}):
+		'''Render the board, its pieces and the given highlights (a
+		{(i, j) : color} dictionary, see highlights) composed from the
+		cached layers. Only the layers that changed are updated, so a
+		frame where nothing moved costs a single blit.
+		Returns the cells that look different since the last call.'''
+		if self.frame is None:
+			self.frame = pygame.Surface((self.w, self.h))
+			self.render_background(self.frame)
+			self.pieces_layer = pygame.Surface((self.w, self.h), \
+					pygame.SRCALPHA, 32)
+			self.overlay = pygame.Surface((self.w, self.h), pygame.SRCALPHA, 32)
+			self.dirty_cells = set([(i, j) for i in range(0, 8) \
+					for j in range(0, 8)])
+		
+		changed = self.dirty_cells
+		self.dirty_cells = set()
+		if changed:
+			self.render_pieces(changed)
+		
+		old = self.overlay_highlights
+		if highlights != old:
+			for cell in set(highlights.keys() + old.keys()):
+				if highlights.get(cell) != old.get(cell):
+					changed.add(cell)
+			self.overlay.fill((0, 0, 0, 0))
+			for (i, j), color in highlights.items():
+				self.render_highlight(self.overlay, i, j, color)
+			self.overlay_highlights = dict(highlights)
+		
+		if changed:
+			self.frame.blit(self.background, (0, 0))
+			self.frame.blit(self.overlay, (0, 0))
+			self.frame.blit(self.pieces_layer, (0, 0))
+		surface.blit(self.frame, (0, 0))
+		return changed
+
+	def render_pieces(self, cells):
+		'''Update the pieces layer for the given cells.'''
+		atlas, rects = image_manager.get_atlas(self.cell_size)
+		layer = self.pieces_layer
+		for i, j in cells:
+			rect = self.cell_rect(i, j)
+			layer.fill((0, 0, 0, 0), rect)
+			piece = self.board[i][j].piece
+			if piece is not None:
+				layer.blit(atlas, rect, rects[piece.sprite])
+
+	def render_highlight(self, surface, i, j, color):
+		'''Fill cell (i, j) with color, leaving a border.'''
+		surface.fill(color, self.cell_rect(i, j).inflate(-10, -10))
 	
 	def pick(self, x, y):
 		'''Try to pick piece in the cell below the x,y screen position.
-		If the cell does not contain a piece, return None.'''
-		for i in range(0, 8):
-			for j in range(0, 8):
-				if self.board[i][j].contains(x, y):
-					self.board[i][j].pick()
-					return self.board[i][j]
-		return None
+		Return the cell, or None if the position is off the board.'''
+		cell_ij = self.cell_at(x, y)
+		if cell_ij is None:
+			return None
+		cell = self.board[cell_ij[0]][cell_ij[1]]
+		cell.pick()
+		return cell
 	
 	def get_piece_at(self, i, j):
 		'''Get the piece at a given position. Returns None if there is 
@@ -169,7 +239,11 @@ class Board:
 			raise Exception("Indices out of board: " + i + " " + j)
 		
 		self.board[i][j].piece = piece
-		self.moves_cache_dirty = True
+		self.dirty_cells.add((i, j))
+		if piece:
+			self.position.put(square(i, j), piece.color, piece.kind)
+		else:
+			self.position.remove(square(i, j))
 		
 	#def move_piece_in_cell_to(self, cell, dest_i, dest_j):
 	#	'''
@@ -187,15 +261,29 @@ class Board:
 		'''Perform a CPU's move. This is basically a hack and will not be
 		needed once the code moves to command-based movements.'''
 		
-		result = self.move_piece_in_cell_to(self[move.from_r][move.from_c],
-						move.to_r, move.to_c)
-		
-		if result and move.type == "Crowning":
-			self[move.to_r][move.to_c].piece.type = move.piece
-		
-		return result
+		promotion = None
+		if move.type == "Crowning":
+			promotion = move.piece
+
+		return self.move_piece_in_cell_to(self[move.from_r][move.from_c],
+						move.to_r, move.to_c, promotion)
 	
-	def move_piece_in_cell_to(self, cell, dest_i, dest_j):
+	def find_move(self, from_i, from_j, dest_i, dest_j, promotion = None):
+		'''Find the legal Position move going from (from_i, from_j)
+		to (dest_i, dest_j). Pawns reaching the last row are promoted to 
+		promotion (a piece type name), or to a queen by default.
+		Returns None if there is no such move.'''
+		frm = square(from_i, from_j)
+		moves = self.legal_move_set(frm)
+		code = encode_move((frm, square(dest_i, dest_j), None))
+		if code in moves:
+			return decode_move(code)
+		code |= PIECE_CODES.get(promotion or "queen") << 12
+		if code in moves:
+			return decode_move(code)
+		return None
+
+	def move_piece_in_cell_to(self, cell, dest_i, dest_j, promotion = None):
 		'''Try to move the piece in cell from where it is to 
 		(dest_i, dest_j).Returns True if the piece could be moved, 
 		False otherwise.'''
@@ -209,65 +297,62 @@ class Board:
 
 		#print "moving piece in cell", cell.i, cell.j, "to:", dest_i, dest_j
 
-		valid_moves = cell.piece.get_moves(cell.i, cell.j, self)
-		if not (dest_i, dest_j) in valid_moves:
+		move = self.find_move(cell.i, cell.j, dest_i, dest_j, promotion)
+		if move is None:
 			return False
-		
-		#Castling
-		if cell.piece.type == "king":
-			if self.can_perform_castling(cell.piece.owner, dest_i):
-				self.perform_castling(cell, dest_i, dest_j)
-				self.moves_cache_dirty = True
-				self.clear_opponent_en_passant(self[dest_i][dest_j].piece.owner)
-				return True
-			else:
-				if dest_j == cell.j-2 or dest_j == cell.j+2:
-					raise Exception("Castling Failed "+  \
-					"(dest_j = %d but can_perform_castling returned false)", (dest_j))
 
-		#Destination empty or with an enemy
-		if self[dest_i][dest_j].piece is None or \
-			self[dest_i][dest_j].piece.owner != cell.piece.owner:
-		
-			if cell.piece.type == "king":
-				self.flag_king_movement(cell.piece.owner)
-			elif cell.piece.type == "rook":
-				self.flag_rook_movement(cell)
-
-			#Promotion
-			if cell.piece.type == "pawn" and \
-				(dest_j == 0 or dest_j == 7 or \
-				pygame.key.get_mods() & pygame.KMOD_SHIFT):
-				
-				cell.piece.type = "queen"
-			
-			#En passant
-			if cell.piece.type == "pawn":
-				#are we /moving/ en passant?
-				if cell.piece.owner == "white" and cell.j == 6 and dest_j == 4:
-					self.white_en_passant = dest_i
-				elif cell.piece.owner == "black" and cell.j == 1 and dest_j == 3:
-					self.black_en_passant = dest_i
-
-				#are we /attacking/ en passant?
-				if dest_i != cell.i and not self[dest_i][dest_j].piece:
-					if cell.piece.owner == "white":
-						self[dest_i][dest_j+1].piece = None
-					else:
-						self[dest_i][dest_j-1].piece = None
-			
-		        #Move the piece
-			self.board[dest_i][dest_j].piece = cell.piece
-			self.board[cell.i][cell.j].piece = None
-			self.moves_cache_dirty = True
-			self.clear_opponent_en_passant(self[dest_i][dest_j].piece.owner)
-			return True
-	
-		print "Should never reach this point"
-		return False
+		mailbox = self.position.mailbox
+		irreversible = mailbox[move[1]] or mailbox[move[0]] & 7 == PAWN
+
+		self.make_move(move)
+		self.sync_cells()
+
+		if irreversible:
+			#Earlier positions cannot come back
+			self.repetitions = {}
+			self.halfmove_clock = 0
+		else:
+			self.halfmove_clock += 1
+		self.record_position()
+		return True
+
+	def start_history(self):
+		'''Start the game history at the current position.'''
+		self.hash_history = []
+		self.repetitions = {}
+		self.halfmove_clock = 0
+		self.record_position()
+
+	def record_position(self):
+		key = self.position.hash
+		self.hash_history.append(key)
+		self.repetitions[key] = self.repetitions.get(key, 0) + 1
+
+	def make_move(self, move):
+		'''Play a Position move (see find_move) on this board without
+		touching the cells, and return an undo record for unmake_move.
+		The position is restored in place by unmake_move.'''
+		return self.position.make_move(move)
+
+	def unmake_move(self, undo):
+		'''Restore the position as it was before make_move.'''
+		self.position.unmake_move(undo)
+
+	def sync_cells(self):
+		'''Update the cells' pieces so they match the position. Castling 
+		and en passant touch cells other than the origin and destination,
+		so all of them are checked.'''
+		mailbox = self.position.mailbox
+		for sq in range(0, 64):
+			cell = self.board[sq & 7][sq >> 3]
+			piece = PIECES[mailbox[sq]]
+			if cell.piece is not piece:
+				cell.piece = piece
+				self.dirty_cells.add((sq & 7, sq >> 3))
 	
-	def render_moves_for_piece_in_cell(self, surface, cell):
-		'''Highlight possible moves for the piece in the given cell'''
+	def highlights(self, cell):
+		'''Highlight color for the given cell and each of its piece's
+		possible moves, as a {(i, j) : color} dictionary.'''
 		if cell.piece is None:
 			raise Exception("cell does not contain a piece!")
 		
@@ -279,15 +364,15 @@ class Board:
 			color = (255, 0, 0)
 			color2 = (180, 0, 0)
 
-		#print "[render_moves_for_piece_in_cell] Calling get_moves for", cell.piece.type
 		#t_ini = time.time()
 		dests = cell.piece.get_moves(cell.i, cell.j, self)
 		#print "get_moves ran in", time.time() - t_ini, "seconds" 
 
+		highlights = {}
 		for dest in dests:
-			self.board[dest[0]][dest[1]].\
-				render_as_highlight(surface, color)
-		cell.render_as_highlight(surface, color2)
+			highlights[dest] = color
+		highlights[(cell.i, cell.j)] = color2
+		return highlights
 	
 	def change_turn(self):
 		'''Make the change of turn.'''
@@ -296,196 +381,113 @@ class Board:
 			self.current_turn = "black"
 		else:
 			self.current_turn = "white"
+		self.position.set_turn(COLOR_CODES[self.current_turn])
 		
 		return self.current_turn
-		
-	def clear_opponent_en_passant(self, owner):
-		if owner == "white" and self.black_en_passant:
-			self.black_en_passant = None
-		elif owner == "black" and self.white_en_passant:
-			self.white_en_passant = None
-
-	def flag_king_movement(self, owner):
-		'''Flag that the given owner's king has moved. It will no longer
-		be able to perform castling.'''
-		if owner == "white":
-			self.white_king_moved = True
-		else:
-			self.black_king_moved = True
-	
-	def flag_rook_movement(self, cell):
-		if cell.piece.owner == "white":
-			if cell.i == 0 and cell.j == 7 and not self.white_tower_left_moved:
-				self.white_tower_left_moved = True
-			elif cell.i == 7 and cell.j == 7 and not self.white_tower_right_moved:
-				self.white_tower_right_moved = True
-		else:
-			if cell.i == 0 and cell.j == 0 and not self.black_tower_left_moved:
-				self.black_tower_left_moved = True
-			elif cell.i == 7 and cell.j == 0 and not self.black_tower_right_moved:
-				self.black_tower_right_moved = True
 			
-	def can_perform_castling(self, owner, dest_i):
-		'''Determine whether the owner (black or white) can perform
-		castling with the right or left rook, depending on dest_i'''
-
-		if owner == "white" and self.white_king_moved:
-			return False
-		
-		if owner == "black" and self.black_king_moved:
-			return False
+	def position_info(self):
+		'''Get the cached PositionInfo for the current position.'''
+		key = self.position.hash
+		info = position_cache.get(key)
+		if info is None:
+			info = PositionInfo()
+			position_cache.put(key, info)
+		return info
+
+	def attack_map(self):
+		'''Get the AttackMap of the current position (cached).'''
+		info = self.position_info()
+		if info.attacks is None:
+			info.attacks = AttackMap(self.position)
+		return info.attacks
+
+	def threat_highlights(self, owner):
+		'''Highlight colors for the cells attacked by owner's enemy, 
+		darker the more pieces attack them, as a {(i, j) : color} 
+		dictionary.'''
+		enemy = COLOR_CODES[owner] ^ 1
+		highlights = {}
+		for cell, count in self.attack_map().attacked_cells(enemy).items():
+			highlights[cell] = (255, max(0, 200 - 60 * count), 0)
+		return highlights
+
+	def legal_moves_from(self, sq):
+		'''Get the legal moves of the piece on square sq, packed in an 
+		array (see movecode). Results are cached per position.'''
+		info = self.position_info()
+		moves = info.moves.get(sq)
+		if moves is None:
+			moves = move_list(self.position.legal_moves_from(sq))
+			info.moves[sq] = moves
+		return moves
+
+	def legal_move_set(self, sq):
+		'''The codes of legal_moves_from(sq) as a set, so looking a move
+		up does not scan the array.'''
+		info = self.position_info()
+		codes = info.move_sets.get(sq)
+		if codes is None:
+			codes = frozenset(self.legal_moves_from(sq))
+			info.move_sets[sq] = codes
+		return codes
+
+	def legal_destinations(self, i, j):
+		'''Get the (column, row) cells the piece at (i, j) can legally 
+		move to.'''
+		#Under-promotions share their destination with the queen one
+		return [coords((code >> 6) & 63) for code in self.legal_moves_from(square(i, j)) \
+				if (code >> 12) in (0, QUEEN)]
+
+	def game_status(self):
+		'''Status for the side to move: "playing", "checkmate", 
+		"stalemate", "repetition" (the position was seen three times) or
+		"fifty_moves" (fifty moves by each side without captures or pawn
+		moves). The last three are draws, see DRAW_STATUSES.'''
+		info = self.position_info()
+		if info.status is None:
+			if self.position.has_legal_moves():
+				info.status = "playing"
+			elif self.king_is_checked(COLOR_NAMES[self.position.turn]):
+				info.status = "checkmate"
+			else:
+				info.status = "stalemate"
 		
-		if owner == "white" and dest_i == 6 and self.white_tower_right_moved:
-			return False
-
-		if owner == "white" and dest_i == 2 and self.white_tower_left_moved:
-			return False
-
-		if owner == "black" and dest_i == 6 and self.black_tower_right_moved:
-			return False
-
-		if owner == "white" and dest_i == 2 and self.black_tower_left_moved:
-			return False
-
-		if dest_i != 2 and dest_i != 6:
-			return False
-
-		return True
-
-	def perform_castling(self, cell, dest_i, dest_j):
-		'''Perform Castling between the king and a rook'''
-		owner = cell.piece.owner
-		if dest_i == cell.i + 2:
-			#move king:
-			self.board[dest_i][dest_j].piece = cell.piece
-			cell.piece = None
-			#move rook:
-			self.board[dest_i-1][dest_j].piece = self.board[dest_i+1][dest_j].piece
-			self.board[dest_i+1][dest_j].piece = None
-
-		elif dest_i == cell.i - 2:
-			#move king:
-			self.board[dest_i][dest_j].piece = cell.piece
-			cell.piece = None
-			#move rook:
-			self.board[dest_i+1][dest_j].piece = self.board[dest_i-2][dest_j].piece
-			self.board[dest_i-2][dest_j].piece = None
-
-		if owner == "white":
-			self.white_king_moved = True
-		else:
-			self.black_king_moved = True
-		return True
+		#Repetitions depend on the game, not only on the position, so
+		#they are not cached
+		if info.status == "playing":
+			if self.repetitions.get(self.position.hash, 0) >= 3:
+				return "repetition"
+			if self.halfmove_clock >= 100:
+				return "fifty_moves"
+		return info.status
+
+	def probe_tablebase(self):
+		'''Exact result of the current position, if it has at most 4 
+		pieces and its endgame table is available: a (result, moves) pair
+		for the side to move, result being "win", "draw" or "loss" and
+		moves the distance to mate. None otherwise.'''
+		if not AppConfig.tablebases:
+			return None
+		return tablebases.probe(self.position)
+
+	def tablebase_move(self):
+		'''The perfect move for the side to move according to the endgame
+		tables (a Position move), or None if they do not cover it.'''
+		if not AppConfig.tablebases:
+			return None
+		return tablebases.best_move(self.position)
 
 	def king_is_checked(self,owner):
 		'''Check whether the king of the given owner is under attack'''
-		#Find the king and all attackers
-		king_pos = self.get_king_position(owner)
-		enemy_moves = self.get_all_oponent_moves(owner)
-
-		threats = filter(lambda x:x == king_pos, enemy_moves)
-		if len(threats) > 0:			
-			return True
-		return False
-
-#	def king_is_checkmated(self,owner):
-#		'''Determine whether a given king is check mated'''
-#		ki, kj = self.get_king_position(owner)
-#		enemy_moves = self.get_all_oponent_moves(owner)
-#		king_moves = self.board[ki][kj].piece.get_moves(ki, kj, self)
-#		king_threatened = (ki, kj) in enemy_moves
-
-#		if not king_threatened:
-#			return False
-
-#		for king_move in king_moves:
-#			if king_move not in enemy_moves and not self.board[king_move[0]][king_move[1]].piece:
-#				print "Possible escape:", king_move
-#				return False
-
-		#King is threatened and there is no escape: try to kill attacker(s):
-#		my_moves = self.get_all_oponent_moves(owner == "white" and "black" or "white")
-
-#		attackers = []
-#		for i in range(0, 8):
-#			for j in range(0, 8):
-#				if self.board[i][j].piece and self.board[i][j].piece.owner != owner:
-#					moves = self.board[i][j].piece.get_moves(i,j, self)
-#					if (ki, kj) in moves:
-#						attackers.append((i,j))
-
-#		for i,j in attackers:
-#			if (i, j) not in my_moves or (i, j) in enemy_moves:
-#				print "Some attacker cannot be killed"
-#				return True #Some attacker cannot be killed
-
-		#All attackers could be killed by my moves
-#		print "All (", len(attackers), ") attackers can be killed"
-
-	def king_is_checkmated(self,owner):
-		'''Determine whether a given king is checkmated.'''
-
-		# If I cant make a move then it's a checkmate. Easy, huh? ;)
-		my_moves = self.get_all_oponent_moves(owner == "white" and "black" or "white")
-
-		if my_moves:
-		    return False
-		else:
-		   print "Some Attacker cannot be killed"
-		   return True
-		     
+		color = COLOR_CODES[owner]
+		if color != self.position.turn:
+			return self.position.in_check(color)
+
+		info = self.position_info()
+		if info.checked is None:
+			info.checked = self.position.in_check(color)
+		return info.checked
 
 	def get_king_position(self,owner):
 		'''Find the owner's (white or black) king's position'''
-		for i in range(0, 8):
-			for j in range(0, 8):
-				if self.board[i][j].piece:
-					piece = self.board[i][j].piece
-					if piece.type == "king" and piece.owner == owner:
-						return (i,j)
-		raise Exception("Error:", owner, "king not found!!")
-
-	def get_all_oponent_moves(self, owner):
-		'''Get all owner's enemies moves'''
-		
-		if owner == "white":
-			enemy = "black"
-		else:
-			enemy = "white"
-
-		if not self.moves_cache_dirty:
-			print "Moves cache hit!"
-			return self.all_moves[enemy]
-
-		print "move cache missed"
-		t_ini = time.time()
-
-		#rebuild move cache:
-		self.all_moves["white"] = []
-		self.all_moves["black"] = []
-		for i in range(0, 8):
-			for j in range(0, 8):
-				if self.board[i][j].piece:
-					piece = self.board[i][j].piece
-					self.all_moves[piece.owner].extend(piece.get_moves(i, j, self, True))
-
-		self.moves_cache_dirty = False
-		print "Move cache rebuilt in %.5f secs" % (time.time() - t_ini)
-		return self.all_moves[enemy]
-		#
-		#all_moves = []
-		#for i in range(0, 8):
-		#	for j in range(0, 8):
-		#		if self.board[i][j].piece:
-		#			piece = self.board[i][j].piece
-		#			if piece.owner != owner:
-		#				all_moves.extend(piece.get_moves(i, j, self, True))
-
-		#Cache moves:
-		#if enemy == "black":
-		#	self.black_moves_dirty = False
-		#else:
-		#	self.white_moves_dirty = False
-		#self.all_moves[enemy] = all_moves
-		
-		#return all_moves
+		return coords(self.position.king_square(COLOR_CODES[owner]))
@@ -21,10 +21,16 @@ import pygame, sys, os
 from piece import *
 from messenger import *
 from chessengine import *
+from timecontrol import *
+from openingbook import opening_book
+from board import DRAW_STATUSES
 
 MODE_P_VS_CPU = 0
 MODE_P_VS_P = 1
 
+#Posted when the engine has an answer, to wake up the event loop
+ENGINE_EVENT = pygame.USEREVENT
+
 class BoardController:
 
 	def __init__(self, board, mode = MODE_P_VS_P, game_code = "0", logpath = "."):
@@ -40,23 +46,30 @@ class BoardController:
 
 		#IA related
 		self.ia = None
+		self.time_manager = None
 		self.mode = mode
 		if mode == MODE_P_VS_CPU:
-			try:
-				self.ia = GnuChess()
-			except Exception,ex:
-				print "Cannot start gnuchess:", ex.message, \
-					"defaulting to player vs. player mode"
-				self.mode = MODE_P_VS_P
+			self.ia = engine_manager.acquire()
+			clock = GameClock(AppConfig.clock_base_ms, AppConfig.clock_increment_ms)
+			self.time_manager = TimeManager(get_level(AppConfig.strength), clock)
+			clock.start("white")
 
 		self.last_p_move = None #no last known player move
+		self.ia_request = None #engine answer being computed
+		self.use_book = AppConfig.opening_book #still in book?
 
 		#Animation related
 		self.rendering_animation = False
 
 	def shutdown(self, message = None):
-		if self.mode == MODE_P_VS_CPU and self.ia:
-			self.ia.close()
+		'''End this game. The engine is left running for the next one
+		(see chessengine.EngineManager), but it stops thinking:
+		pondering is cancelled and a search in progress is cut short.'''
+		if self.ia:
+			self.ia.stop_pondering()
+			if self.ia_request is not None and not self.ia_request.done():
+				self.ia.stop()
+		self.ia = None
 		if message:
 			self.move_log.write(message + "\n")
 		self.move_log.close()
@@ -72,10 +85,11 @@ class BoardController:
 			kind = kind_by_char.get(char.upper())
 			
 			if kind:
-				self.board.put_piece_at(Piece(kind, player), column, row)
+				self.board.put_piece_at(get_piece(kind, player), column, row)
 			if column == 7:
 				column, row = -1, row + 1
 			column = column + 1
+		self.board.start_history()
 	
 	def init_board(self):
 		'''Initialize board to starting chess configuration'''
@@ -87,24 +101,138 @@ class BoardController:
 		calling the IA, etc.'''
 		#TODO: Animate piece movements
 
-		#Call IA:
-		if self.ia and self.board.current_turn == "black" and self.game_state != "checkmate":
-			if self.last_p_move:
+		#Call IA. The engine thinks on a background thread, the answer
+		#is applied by a later update once it is ready:
+		if self.ia and self.board.current_turn == "black" and self.game_state == "playing":
+			if self.last_p_move and not self.ia_request:
+				self.time_manager.clock.start("black")
+				known_move = self.known_answer()
+				if known_move is not None:
+					#Answer right away, the engine just follows along. The
+					#answer is handed over like an engine's, so ENGINE_EVENT
+					#wakes up the event loop and it is applied below
+					ans = to_game_move(known_move)
+					self.ia.play(self.last_p_move)
+					self.ia.play(ans)
+					self.last_p_move = None
+					self.ia_request = EngineRequest(self.on_ia_answer)
+					self.ia_request.set_result(ans)
+
+			if self.last_p_move and not self.ia_request:
 				print "Calling IA:"
-				#try:
-				ans = self.ia.move(self.last_p_move)
-				cpu_from_cell = self.board[ans.from_r][ans.from_c]
-				self.move_log.write(str(self.board.current_turn) + ": " + \
-					str(ans.from_r) + "," + str(ans.from_c) +\
-					" to " + str(ans.to_r) + "," + str(ans.to_c) + "\n")
-				
-				#if not self.board.move_piece_in_cell_to(cpu_from_cell, ans.to_r, ans.to_c):
-				if not self.board.cpu_move_piece(ans):
-					print "IA made an illegal move:",\
-						ans.from_r, ans.from_c, "to",\
-						ans.to_r, ans.to_c
-					raise Exception("IA out of sync!")
-				self.board.change_turn()
+				self.ia.set_limits(self.time_manager.limits("black"), \
+						self.time_manager.cutoff("black"))
+				self.ia_request = self.ia.request_move(self.last_p_move, \
+							self.on_ia_answer)
+				self.last_p_move = None
+
+			elif self.ia_request and self.ia_request.done():
+				ans = self.ia_request.result()
+				self.ia_request = None
+				if self.update_game_state() == "timeout":
+					return
+				self.play_cpu_move(ans)
+				self.update_game_state()
+				if AppConfig.ponder and self.game_state == "playing":
+					self.ia.ponder()
+
+	def known_answer(self):
+		'''Find a reply that needs no search: a perfect endgame move from
+		the tablebases or a move from the opening book. Returns a Position
+		move, or None.'''
+		move = self.board.tablebase_move()
+		if move is not None:
+			print "Tablebase move:", move_name(move)
+			return move
+
+		if self.use_book:
+			move = opening_book.choose(self.board.position)
+			if move is not None:
+				print "Book move:", move_name(move)
+				return move
+			print "Out of the opening book"
+			self.use_book = False
+		return None
+
+	def play_cpu_move(self, ans):
+		'''Play the CPU's answer (a Move or Crowning) on the board.'''
+		self.time_manager.clock.start("white")
+		self.move_log.write(str(self.board.current_turn) + ": " + \
+			str(ans.from_r) + "," + str(ans.from_c) +\
+			" to " + str(ans.to_r) + "," + str(ans.to_c) + "\n")
+		
+		#if not self.board.move_piece_in_cell_to(cpu_from_cell, ans.to_r, ans.to_c):
+		if not self.board.cpu_move_piece(ans):
+			print "IA made an illegal move:",\
+				ans.from_r, ans.from_c, "to",\
+				ans.to_r, ans.to_c
+			raise Exception("IA out of sync!")
+		self.board.change_turn()
+
+	def update_game_state(self):
+		'''Check whether the game is over after the last move and set
+		game_state: "playing", "checkmate", "draw" (stalemate, threefold
+		repetition or the fifty-move rule) or "timeout" (the side to move
+		ran out of time on the game clock). When the game is over the
+		clock stops and so does the engine: pondering is cancelled and a search in 
+		progress is cut short. Returns the board's game status, or 
+		"timeout".'''
+		if self.game_state == "timeout":
+			return "timeout"
+		status = self.board.game_status()
+		if status == "playing" and self.time_manager is not None and \
+			self.time_manager.clock.flagged(self.board.current_turn):
+			status = "timeout"
+		if status == "checkmate":
+			self.game_state = "checkmate"
+		elif status in DRAW_STATUSES:
+			self.game_state = "draw"
+		elif status == "timeout":
+			self.game_state = "timeout"
+		else:
+			self.game_state = "playing"
+		if self.game_state != "playing" and self.time_manager is not None:
+			self.time_manager.clock.pause()
+		if self.game_state != "playing" and self.ia:
+			self.ia.stop_pondering()
+			if self.ia_request is not None and not self.ia_request.done():
+				self.ia.stop()
+		return status
+
+	def pause_clock(self, paused):
+		'''Stop the game clock while the game is not on screen (the menu
+		is shown), restart it when the game is back.'''
+		if self.time_manager is None:
+			return
+		if paused:
+			self.time_manager.clock.pause()
+		elif self.game_state == "playing":
+			self.time_manager.clock.resume()
+
+	def time_left(self):
+		'''(white, black) milliseconds left on the game clock, or None
+		if this game has no clock.'''
+		if self.time_manager is None:
+			return None
+		clock = self.time_manager.clock
+		return clock.time_left("white"), clock.time_left("black")
+
+	def set_strength(self, name):
+		'''Change the CPU strength level from its next move on.'''
+		if self.time_manager:
+			self.time_manager.level = get_level(name)
+
+	def player_can_move(self):
+		'''Whether the user may move now. Against the CPU only white's
+		pieces are the user's, and not while an engine answer is pending:
+		the engine would not know about the move.'''
+		if self.mode != MODE_P_VS_CPU:
+			return True
+		return self.board.current_turn == "white" and self.ia_request is None
+
+	def on_ia_answer(self, request):
+		'''Called from the engine thread when an answer is ready.'''
+		pygame.event.post(pygame.event.Event(ENGINE_EVENT))
 
 	#def on_cell_clicked(self, clicked_cell):
 	#	if clicked_cell is None:
@@ -139,6 +267,8 @@ class BoardController:
 		
 		if self.rendering_animation or clicked_cell is None:
 			return
+		if not self.player_can_move():
+			return
 		
 		# Select a piece?
 		if clicked_cell.piece is not None and self.selected_cell is None:
@@ -162,10 +292,13 @@ class BoardController:
 		'''Move the currently selected piece to a new cell. 
 		The currently selected piece is at self.selected_cell.'''
 		
-		if self.game_state == "checkmate":
+		if not self.player_can_move():
+			return
+		self.update_game_state()
+		if self.game_state != "playing":
 			return
 
-		was_pawn = self.selected_cell.piece.type == "pawn"
+		was_pawn = self.selected_cell.piece.kind == PAWN
 
 		# Try to move the piece on the board:
 		to_i, to_j = clicked_cell.i, clicked_cell.j
@@ -180,19 +313,17 @@ class BoardController:
 				from_i = self.selected_cell.i
 				from_j = self.selected_cell.j
 				#check for crowning:
-				if self.board.current_turn == "black" and to_j == 7 and was_pawn:
+				if was_pawn and to_j in (0, 7):
 					self.last_p_move = Crowning((from_i, from_j), (to_i, to_j), \
 								self.board[to_i][to_j].piece.type)
-				elif self.board.current_turn == "white" and to_j == 0 and was_pawn:
-					self.last_p_move = Crowning((from_i),(from_j), (to_i, to_j),\
-								self.board[to_i][to_j].piece.type)
 				else:
 					# just regular move
 					self.last_p_move = Move((from_i, from_j),(to_i, to_j))
 				
 			self.board.change_turn()
 			self.selected_cell = None
+			self.update_game_state()
 		else:
 			if clicked_cell.piece and \
-				self.selected_cell.piece.owner == clicked_cell.piece.owner:
+				self.selected_cell.piece.color == clicked_cell.piece.color:
 					self.selected_cell = clicked_cell
@@ -20,7 +20,8 @@
 import pygame
 from piece import *
 
-class Cell:
+class Cell(object):
+	__slots__ = ("color", "piece", "size", "i", "j")
 
 	def __init__(self, i, j, size, color, piece = None):
 		self.color = color
@@ -36,21 +37,6 @@ class Cell:
 		
 		surface.fill(self.color, pygame.Rect(tx, ty, size, size))
 	
-	def render_foreground(self, surface):
-		if self.piece is not None:
-			size = self.size
-			tx = self.i * size
-			ty = self.j * size
-			self.piece.render(surface, tx, ty, size)
-		
-	def render_as_highlight(self, surface, color = (0, 255, 0)):
-		size = self.size
-		tx = self.i * size
-		ty = self.j * size
-		
-		#surface.fill((0, 0, 0), pygame.Rect(tx, ty, size, size))
-		surface.fill(color, pygame.Rect(tx+5, ty+5, size-10, size-10))
-		
 	#def render(self, surface):
 	#	size = self.size
 	#	tx = self.i * size
@@ -66,8 +52,8 @@ class Cell:
 		tx = self.i * self.size
 		ty = self.j * self.size
 		
-		if x > tx and x < tx + self.size and \
-			y > ty and y < ty + self.size:
+		if x >= tx and x < tx + self.size and \
+			y >= ty and y < ty + self.size:
 				return True
 				
 	def pick(self):
@@ -1,5 +1,9 @@
-import popen2, os, sys
-from piece import Move
+import popen2, os, sys, threading, Queue
+from piece import Move, Crowning
+from alphabeta import AlphaBetaEngine
+from engineprotocol import *
+from timecontrol import TimeManager, get_level
+from appconfig import AppConfig
 
 class GnuChess:
 	'''GNU Chess wrapper class.'''
@@ -33,7 +37,10 @@ class GnuChess:
 			print "Engine is not executable, try: chmod +x", engine_path.split()[0]
 			raise IOError("Chess engine is not executable!")
 
-		self.fin, self.fout = popen2.popen2(engine_path)
+		self.process = popen2.Popen3(engine_path)
+		self.fin, self.fout = self.process.fromchild, self.process.tochild
+		self.limits = SearchLimits(depth = 0)
+		self.forced = False
 
 		#Check pipe:
 		self.fout.write("\n")
@@ -41,8 +48,58 @@ class GnuChess:
 		self.fin.readline()
 		self.fin.readline()
 		self.fin.readline()
-		self.fout.write("depth 0\n")
+		self.send_limits()
 		
+	def new_game(self):
+		'''Reset the engine to the starting position.'''
+		self.fout.write("new\n")
+		self.fout.write("easy\n")
+		self.forced = False
+		self.send_limits()
+
+	def set_limits(self, limits):
+		'''Set the depth and time per move (a SearchLimits) of the next
+		moves. GNU Chess has no node limit.'''
+		self.limits = limits
+		self.send_limits()
+
+	def send_limits(self):
+		#Depth 0 takes back a depth limit sent before
+		self.fout.write("depth %d\n" % (self.limits.depth or 0))
+		if self.limits.movetime is not None:
+			self.fout.write("st %d\n" % max(1, self.limits.movetime / 1000))
+		self.fout.flush()
+
+	def stop(self):
+		'''Make the engine play its best move so far right away.'''
+		self.fout.write("?\n")
+		self.fout.flush()
+
+	def play(self, move):
+		'''Play a move (of either side) without thinking, in force mode.'''
+		if not self.forced:
+			self.fout.write("force\n")
+			self.forced = True
+		self.fout.write(self.move_to_gnuchess(move) + "\n")
+		self.fout.flush()
+
+	def ponder(self):
+		'''Let GNU Chess think on the player's time. It ponders on its
+		own after each of its moves until the next new game.'''
+		self.fout.write("hard\n")
+		self.fout.flush()
+
+	def ponder_answer(self, move):
+		return
+
+	def cancel_ponder(self):
+		'''Stop pondering (the game is over). Runs on the engine thread.'''
+		self.fout.write("easy\n")
+		self.fout.flush()
+
+	def is_alive(self):
+		return self.process.poll() == -1
+
 
 	def move(self, move):
 		'''Write a player's move to GNU Chess. Return the engine's move.'''
@@ -50,24 +107,56 @@ class GnuChess:
 
 		print "Calling GNU Chess with move:", move_str
 		self.fout.write(move_str + "\n")
+		if self.forced:
+			#Moves were played in force mode, make it think again
+			self.fout.write("go\n")
+			self.forced = False
 		self.fout.flush()
 		l = self.fin.readline()
 		while l.find("My move is") == -1:
 			if l.find("Illegal move") != -1:
 				raise Exception("Illegal move")
+			if l == "":
+				raise IOError("GNU Chess closed the pipe")
 			l = self.fin.readline()
 		ans = l.split()[3]
 		print ans
-		if len(ans) == 4:
-			return Move(self.gnuchess_to_coords(ans[:2]), \
-				self.gnuchess_to_coords(ans[2:]))
-		elif len(ans) == 5:
-			return Crowning(self.gnuchess_to_coords(ans[:2]), \
-				self.gnuchess_to_coords(ans[2:4]), \
-				self.decode_piece(ans[4]))
-		else:
-			raise Exception("IA Error, unknown answer: " + ans)
-		
+		return self.parse_answer(ans)
+
+	def parse_answer(self, ans):
+		'''Translate a move in GNU Chess notation to a Move/Crowning.'''
+		return notation_to_move(ans)
+
+	def analyse(self, fen, depth):
+		'''Search the position given as a FEN string to the given depth.
+		Returns (best move, score in centipawns for the side to move, 
+		depth reached). The move is None if the game is over.'''
+		self.fout.write("force\n")
+		self.fout.write("setboard " + fen + "\n")
+		self.fout.write("post\n")
+		self.fout.write("depth %d\n" % depth)
+		self.fout.write("go\n")
+		self.fout.flush()
+
+		score, reached = None, 0
+		l = self.fin.readline()
+		while l.find("My move is") == -1:
+			if l == "":
+				raise IOError("GNU Chess closed the pipe")
+			if l.find("Illegal") != -1:
+				raise Exception("GNU Chess rejected position: " + fen)
+			fields = l.split()
+			if fields and fields[0] in ("1-0", "0-1", "1/2-1/2"):
+				return None, score, reached
+			#Thinking output: ply score time nodes pv...
+			if len(fields) >= 4 and fields[0].rstrip(".&").isdigit():
+				try:
+					reached, score = int(fields[0].rstrip(".&")), int(fields[1])
+				except ValueError:
+					pass
+			l = self.fin.readline()
+		return self.parse_answer(l.split()[3]), score, reached
+
 	def close(self):
 		self.fout.write("quit\n")
 		self.fout.flush()
@@ -76,34 +165,226 @@ class GnuChess:
 	
 
 	def decode_piece(self, piece):
-		p = piece.lower()
-		if p == "q":
-			return "queen"
-		if p == "k":
-			return "knight"
-		if p == "b":
-			return "bishop"
-		if p == "r":
-			return "rook"
-		
-		raise Exception("IA Error: Cannot determine Crowning type!")
-	
+		try:
+			return PROMOTION_PIECES[piece.lower()]
+		except KeyError:
+			raise Exception("IA Error: Cannot determine Crowning type!")
 
 	def move_to_gnuchess(self, move):
-		move_str = self.coords_to_gnuchess(move.from_r, move.from_c) + \
-			self.coords_to_gnuchess(move.to_r, move.to_c)
-			
-		if move.type == "Crowning":
-			move_str += move.piece[0]
-			
-		return move_str
+		return move_to_notation(move)
 
 	def coords_to_gnuchess(self, i, j):
-		letters = ["a", "b", "c", "d", "e", "f", "g", "h"]
-		return letters[i] + str(8-j)
+		return coords_to_notation(i, j)
 
 	def gnuchess_to_coords(self, move):
-		letters = ["a", "b", "c", "d", "e", "f", "g", "h"]
-		i = letters.index(move[0])
-		j = int(8 - int(move[1]))
-		return (i,j)
+		return notation_to_coords(move)
+
+
+class EngineRequest:
+	'''Pending answer of an engine running on a background thread.
+	Poll done() and then call result() to get the engine's move, or
+	the exception raised while computing it.'''
+	def __init__(self, callback = None):
+		self.finished = threading.Event()
+		self.callback = callback
+		self.answer = None
+		self.error = None
+
+	def done(self):
+		return self.finished.isSet()
+
+	def wait(self, timeout = None):
+		self.finished.wait(timeout)
+		return self.done()
+
+	def result(self):
+		if not self.done():
+			raise Exception("Engine request is still pending")
+		if self.error is not None:
+			raise self.error
+		return self.answer
+
+	def set_result(self, answer, error = None):
+		self.answer, self.error = answer, error
+		self.finished.set()
+		if self.callback:
+			self.callback(self)
+
+
+class AsyncEngine:
+	'''Run an engine (GnuChess, AlphaBetaEngine...) on a background
+	thread so the caller does not block while it thinks. Requests 
+	(moves and new games) are served one at a time, in order.'''
+	def __init__(self, engine):
+		self.engine = engine
+		self.cutoff = None
+		self.pondering = False
+		self.requests = Queue.Queue()
+		self.worker = threading.Thread(target = self.run)
+		self.worker.setDaemon(True)
+		self.worker.start()
+
+	def request_move(self, move, callback = None):
+		'''Send a player's move to the engine. Returns an EngineRequest
+		for the engine's answer; callback, if given, is called with it
+		from the worker thread once the answer is available.'''
+		if self.pondering:
+			self.pondering = False
+			self.engine.ponder_answer(move)
+		request = EngineRequest(callback)
+		self.requests.put((self.timed_move, (move,), request))
+		return request
+
+	def play(self, move):
+		'''Play a move of either side without asking the engine for an
+		answer (it was taken from the opening book).'''
+		self.stop_pondering()
+		request = EngineRequest()
+		self.requests.put((self.engine.play, (move,), request))
+		return request
+
+	def ponder(self):
+		'''Let the engine think on the player's time, on the reply it
+		expects. The next request_move tells it whether it guessed right:
+		if so it answers with what it already searched.'''
+		self.pondering = True
+		self.requests.put((self.engine.ponder, (), EngineRequest()))
+
+	def stop_pondering(self):
+		'''Make the engine stop thinking on the player's time, because 
+		the game is over or the player's move will not be searched.
+		Searches running in this process are stopped at once, engine
+		processes are told to stop once the pending requests are served.'''
+		if self.pondering:
+			self.pondering = False
+			self.engine.ponder_answer(None)
+			self.requests.put((self.engine.cancel_ponder, (), EngineRequest()))
+
+	def set_limits(self, limits, cutoff = None):
+		'''Apply new SearchLimits from the next move on. cutoff is an
+		emergency limit in milliseconds: if the engine thinks longer, it
+		is told to move at once.'''
+		request = EngineRequest()
+		self.requests.put((self.apply_limits, (limits, cutoff), request))
+		return request
+
+	def new_game(self):
+		'''Reset the engine once the pending requests are served.'''
+		self.stop_pondering()
+		request = EngineRequest()
+		self.requests.put((self.engine.new_game, (), request))
+		return request
+
+	def is_alive(self):
+		return self.worker.isAlive() and self.engine.is_alive()
+
+	def move(self, move):
+		'''Blocking version of request_move.'''
+		request = self.request_move(move)
+		request.wait()
+		return request.result()
+
+	def close(self):
+		self.stop_pondering()
+		self.requests.put(None)
+		self.engine.close()
+		#Give the worker a chance to finish (it is a daemon thread anyway)
+		self.worker.join(0.5)
+
+	def apply_limits(self, limits, cutoff):
+		self.cutoff = cutoff
+		self.engine.set_limits(limits)
+
+	def timed_move(self, move):
+		timer = None
+		if self.cutoff:
+			timer = threading.Timer(self.cutoff / 1000.0, self.emergency_stop)
+			timer.setDaemon(True)
+			timer.start()
+		try:
+			return self.engine.move(move)
+		finally:
+			if timer:
+				timer.cancel()
+
+	def stop(self):
+		'''Make the engine answer the current request at once.'''
+		self.engine.stop()
+
+	def emergency_stop(self):
+		print "Engine is over its time, forcing it to move"
+		self.stop()
+
+	def run(self):
+		while True:
+			job = self.requests.get()
+			if job is None:
+				return
+			function, args, request = job
+			try:
+				request.set_result(function(*args))
+			except Exception, ex:
+				request.set_result(None, ex)
+
+
+class EngineManager:
+	'''Keep a single CPU engine running across games. Starting GNU Chess
+	(process launch, handshake) is only paid for the first game: later 
+	games just reset it. A dead engine is restarted on the next game.
+	Only one instance of this class should exist, engine_manager.'''
+	def __init__(self):
+		self.engine = None
+
+	def acquire(self):
+		'''Get an AsyncEngine ready to play a new game.'''
+		if self.engine is not None and not self.engine.is_alive():
+			print "The engine died, restarting it"
+			try:
+				self.engine.close()
+			except Exception, ex:
+				print "Cannot close dead engine:", ex
+			self.engine = None
+
+		if self.engine is None:
+			self.engine = AsyncEngine(self.start_engine())
+		else:
+			self.engine.new_game()
+		return self.engine
+
+	def start_engine(self):
+		'''Start the engine selected in AppConfig: the bundled GNU Chess,
+		any UCI or xboard engine (AppConfig.engine_command) or the
+		built-in one, which is also the fallback.'''
+		engine = None
+		try:
+			if AppConfig.engine == "gnuchess":
+				engine = GnuChess()
+			elif AppConfig.engine == "uci":
+				engine = UCIEngine(AppConfig.engine_command, print_info)
+			elif AppConfig.engine == "xboard":
+				engine = XBoardEngine(AppConfig.engine_command, print_info)
+		except Exception,ex:
+			print "Cannot start %s engine:" % AppConfig.engine, ex, \
+				"defaulting to the built-in engine"
+		if engine is None:
+			engine = AlphaBetaEngine()
+		#Until a game sets its own, play at the configured strength
+		engine.set_limits(TimeManager(get_level(AppConfig.strength)).limits("black"))
+		return engine
+
+	def shutdown(self):
+		'''Stop the engine for good (when quitting).'''
+		if self.engine is not None:
+			try:
+				self.engine.close()
+			except Exception, ex:
+				print "Cannot close the engine:", ex
+			self.engine = None
+
+engine_manager = EngineManager()
+
+def print_info(info):
+	'''Log an engine's progress report.'''
+	print "depth %s score %s nodes %s nps %s pv %s" % (info.get("depth"), \
+		info.get("score"), info.get("nodes"), info.get("nps"), \
+		" ".join(info.get("pv", [])))
@@ -0,0 +1,353 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Drivers for external engines speaking the UCI or xboard (CECP)
+protocols. Both have the same interface as the GnuChess wrapper (move,
+new_game, close, is_alive), so any engine installed on the machine can
+be used as the CPU opponent by naming it in AppConfig.'''
+import popen2, time
+from movecode import code_to_notation, notation_to_code, \
+	code_to_game_move, game_move_to_code
+
+LETTERS = "abcdefgh"
+PROMOTION_PIECES = {"q" : "queen", "r" : "rook", "b" : "bishop", "n" : "knight",
+		"k" : "knight"}
+
+def coords_to_notation(i, j):
+	'''Translate board coordinates to a square name, such as "e4".'''
+	return LETTERS[i] + str(8 - j)
+
+def notation_to_coords(name):
+	return (LETTERS.index(name[0]), 8 - int(name[1]))
+
+def move_to_notation(move):
+	'''Translate a Move or Crowning to coordinate notation ("e7e8q").'''
+	return code_to_notation(game_move_to_code(move))
+
+def notation_to_move(text):
+	'''Translate coordinate notation to a Move or Crowning.'''
+	try:
+		return code_to_game_move(notation_to_code(text))
+	except ValueError:
+		raise Exception("IA Error, unknown answer: " + text)
+
+
+class SearchLimits:
+	'''What the engine may spend on a move. Any of them can be None.
+	depth is in plies, movetime in milliseconds, and the clocks
+	(wtime, btime) and increments (winc, binc) in milliseconds too.'''
+	def __init__(self, depth = None, movetime = None, nodes = None,
+			wtime = None, btime = None, winc = 0, binc = 0):
+		self.depth = depth
+		self.movetime = movetime
+		self.nodes = nodes
+		self.wtime, self.btime = wtime, btime
+		self.winc, self.binc = winc, binc
+
+
+class EngineProcess:
+	'''An engine running as a child process, talked to through pipes.
+	Subclasses implement the protocol.'''
+
+	def __init__(self, command, on_info = None):
+		'''Start command. on_info, if given, is called with a dictionary
+		(depth, score, nodes, nps, time, pv) for each progress line the
+		engine sends while thinking.'''
+		self.command = command
+		self.on_info = on_info
+		self.limits = SearchLimits()
+		self.last_info = {}
+		self.process = popen2.Popen3(command)
+		self.fin, self.fout = self.process.fromchild, self.process.tochild
+
+	def send(self, line):
+		self.fout.write(line + "\n")
+		self.fout.flush()
+
+	def readline(self):
+		line = self.fin.readline()
+		if line == "":
+			raise IOError("Engine closed the pipe: " + self.command)
+		return line.strip()
+
+	def is_alive(self):
+		return self.process.poll() == -1
+
+	def set_limits(self, limits):
+		self.limits = limits
+
+	def stop(self):
+		'''Make the engine move now (called from another thread).'''
+		pass
+
+	def ponder(self):
+		'''Start thinking on the player's time, on the expected reply.'''
+		pass
+
+	def ponder_answer(self, move):
+		'''The player's move arrived (None: the game was abandoned). 
+		Called from the main thread; drivers handle it in move().'''
+		pass
+
+	def cancel_ponder(self):
+		'''Stop pondering (the game is over). Runs on the engine thread.'''
+		pass
+
+	def report(self, info):
+		self.last_info = info
+		if self.on_info:
+			self.on_info(info)
+
+	def close(self):
+		try:
+			self.send("quit")
+		finally:
+			self.fout.close()
+			self.fin.close()
+
+
+class UCIEngine(EngineProcess):
+	'''Driver for engines speaking the Universal Chess Interface.'''
+
+	def __init__(self, command, on_info = None, options = None):
+		EngineProcess.__init__(self, command, on_info)
+		self.name = command
+		self.pondering = False
+		self.send("uci")
+		line = self.readline()
+		while line != "uciok":
+			if line.startswith("id name "):
+				self.name = line[8:]
+			line = self.readline()
+		for name, value in (options or {}).items():
+			self.send("setoption name %s value %s" % (name, value))
+		self.new_game()
+
+	def wait_ready(self):
+		self.send("isready")
+		while self.readline() != "readyok":
+			pass
+
+	def new_game(self):
+		self.cancel_ponder()
+		self.moves = []
+		self.ponder_move = None
+		self.send("ucinewgame")
+		self.wait_ready()
+
+	def move(self, move):
+		'''Play a player's move and return the engine's answer.'''
+		notation = move_to_notation(move)
+		if self.pondering and notation == self.ponder_move:
+			self.pondering = False
+			self.send("ponderhit")
+			answer = self.wait_bestmove()
+		else:
+			self.cancel_ponder()
+			self.moves.append(notation)
+			answer = self.go()
+		self.moves.append(answer)
+		return notation_to_move(answer)
+
+	def stop(self):
+		self.send("stop")
+
+	def play(self, move):
+		'''Play a move (of either side) without searching.'''
+		self.cancel_ponder()
+		self.moves.append(move_to_notation(move))
+		self.ponder_move = None
+
+	def ponder(self):
+		'''Search the expected reply (the one after our last best move)
+		until the player moves.'''
+		if self.ponder_move is None:
+			return
+		self.moves.append(self.ponder_move)
+		self.send("position startpos moves " + " ".join(self.moves))
+		self.send("go ponder" + self.go_arguments())
+		self.pondering = True
+
+	def cancel_ponder(self):
+		if self.pondering:
+			self.pondering = False
+			self.moves.pop()
+			self.send("stop")
+			self.wait_bestmove(False)
+
+	def go(self):
+		self.send("position startpos moves " + " ".join(self.moves))
+		self.send("go" + self.go_arguments())
+		return self.wait_bestmove()
+
+	def wait_bestmove(self, check = True):
+		'''Read the engine's output up to its best move and return it.
+		The move it expects as a reply is kept for pondering.'''
+		while True:
+			fields = self.readline().split()
+			if not fields:
+				continue
+			if fields[0] == "info":
+				info = parse_uci_info(fields)
+				if "depth" in info:
+					self.report(info)
+			elif fields[0] == "bestmove":
+				self.ponder_move = None
+				if len(fields) >= 4 and fields[2] == "ponder":
+					self.ponder_move = fields[3]
+				if check and fields[1] in ("(none)", "0000"):
+					raise Exception("IA Error: engine has no move")
+				return fields[1]
+
+	def go_arguments(self):
+		limits = self.limits
+		args = ""
+		for name in ("depth", "movetime", "nodes", "wtime", "btime"):
+			value = getattr(limits, name)
+			if value is not None:
+				args += " %s %d" % (name, value)
+		if limits.wtime is not None or limits.btime is not None:
+			args += " winc %d binc %d" % (limits.winc, limits.binc)
+		if not args:
+			#Never send a bare "go": it means think until told to stop
+			args = " movetime 1000"
+		return args
+
+
+def parse_uci_info(fields):
+	'''Parse the fields of an "info ..." line.'''
+	info = {}
+	i = 1
+	while i < len(fields):
+		key = fields[i]
+		if key == "pv":
+			info["pv"] = fields[i + 1:]
+			break
+		if key == "score" and i + 2 < len(fields):
+			#"score cp 20" or "score mate 3"
+			value = int(fields[i + 2])
+			if fields[i + 1] == "mate":
+				value = value > 0 and 100000 - value or -100000 - value
+			info["score"] = value
+			i += 3
+			continue
+		if key in ("depth", "seldepth", "nodes", "nps", "time") and \
+			i + 1 < len(fields):
+			try:
+				info[key] = int(fields[i + 1])
+			except ValueError:
+				pass
+			i += 2
+			continue
+		i += 1
+	return info
+
+
+class XBoardEngine(EngineProcess):
+	'''Driver for engines speaking the xboard protocol (CECP).'''
+
+	def __init__(self, command, on_info = None):
+		EngineProcess.__init__(self, command, on_info)
+		self.forced = False
+		self.send("xboard")
+		self.send("protover 2")
+		self.new_game()
+
+	def new_game(self):
+		self.send("new")
+		self.forced = False
+		self.send("post")
+		self.send("easy")
+		self.send_limits()
+
+	def set_limits(self, limits):
+		EngineProcess.set_limits(self, limits)
+		self.send_limits()
+
+	def stop(self):
+		self.send("?")
+
+	def play(self, move):
+		'''Play a move (of either side) without thinking, in force mode.'''
+		if not self.forced:
+			self.send("force")
+			self.forced = True
+		self.send(move_to_notation(move))
+
+	def ponder(self):
+		'''Let the engine ponder on its own after each of its moves,
+		until the next new game.'''
+		self.send("hard")
+
+	def cancel_ponder(self):
+		self.send("easy")
+
+	def send_limits(self):
+		limits = self.limits
+		#sd 0 takes back a depth limit sent before
+		self.send("sd %d" % (limits.depth or 0))
+		if limits.movetime is not None:
+			self.send("st %d" % max(1, limits.movetime / 1000))
+		elif limits.wtime is not None:
+			#level <moves per control> <base minutes> <increment secs>
+			base = limits.btime or limits.wtime
+			self.send("level 0 %d:%02d %d" % (base / 60000, base / 1000 % 60, \
+					limits.binc / 1000))
+
+	def move(self, move):
+		'''Play a player's move and return the engine's answer.'''
+		limits = self.limits
+		if limits.movetime is None and limits.btime is not None:
+			#Clocks are sent in centiseconds, the engine plays black
+			self.send("time %d" % (limits.btime / 10))
+			self.send("otim %d" % ((limits.wtime or 0) / 10))
+		self.send(move_to_notation(move))
+		if self.forced:
+			#Moves were played in force mode, make it think again
+			self.send("go")
+			self.forced = False
+		t_ini = time.time()
+		while True:
+			line = self.readline()
+			fields = line.split()
+			if not fields:
+				continue
+			if fields[0] == "move":
+				return notation_to_move(fields[1])
+			if line.startswith("My move is"):
+				return notation_to_move(fields[-1])
+			if fields[0].startswith("Illegal") or fields[0] == "Error":
+				raise Exception("Engine rejected move: " + line)
+			info = parse_xboard_thinking(fields, time.time() - t_ini)
+			if info:
+				self.report(info)
+
+
+def parse_xboard_thinking(fields, elapsed):
+	'''Parse a thinking line: ply score time(centisecs) nodes pv...'''
+	if len(fields) < 4 or not fields[0].rstrip(".&").isdigit():
+		return None
+	try:
+		info = {"depth" : int(fields[0].rstrip(".&")), "score" : int(fields[1]),
+			"time" : int(fields[2]) * 10, "nodes" : int(fields[3]),
+			"pv" : fields[4:]}
+	except ValueError:
+		return None
+	seconds = info["time"] / 1000.0 or elapsed
+	info["nps"] = int(info["nodes"] / max(seconds, 1e-3))
+	return info
@@ -0,0 +1,75 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+from collections import OrderedDict
+
+class LRUCache:
+	'''A bounded mapping that evicts its least recently used entries
+	once it holds more than max_size of them. Hits, misses and
+	evictions are counted so cache effectiveness can be checked.'''
+
+	def __init__(self, max_size = 256):
+		self.max_size = max_size
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def get(self, key, default = None):
+		'''Return the value stored for key and mark it as recently used,
+		or return default if key is not cached.'''
+		try:
+			value = self.entries.pop(key)
+		except KeyError:
+			self.misses += 1
+			return default
+		self.entries[key] = value
+		self.hits += 1
+		return value
+
+	def put(self, key, value):
+		'''Store value for key, evicting old entries if needed.'''
+		self.entries.pop(key, None)
+		self.entries[key] = value
+		self.evict()
+
+	def resize(self, max_size):
+		self.max_size = max_size
+		self.evict()
+
+	def evict(self):
+		while len(self.entries) > self.max_size:
+			self.entries.popitem(last = False)
+			self.evictions += 1
+
+	def clear(self):
+		self.entries.clear()
+
+	def stats(self):
+		'''Return a dictionary with the cache counters.'''
+		lookups = self.hits + self.misses
+		return {"size" : len(self.entries), "max_size" : self.max_size,
+			"hits" : self.hits, "misses" : self.misses,
+			"evictions" : self.evictions,
+			"hit_rate" : lookups and float(self.hits) / lookups or 0.0}
@@ -26,12 +26,15 @@ from boardcontroller import *
 from menu import *
 from ui import *
 from resourcemanager import image_manager
+from timecontrol import get_level, next_level
+from appconfig import AppConfig
+
+#Posted every second while a game clock runs, to redraw it
+CLOCK_EVENT = pygame.USEREVENT + 1
 
 def clear(surface):
 	surface.fill((0, 0, 0))
-		
-def update():
-	pygame.display.flip()
+
 
 def main(requested_w, requested_h):
 	pygame.init()
@@ -70,9 +73,11 @@ def main(requested_w, requested_h):
 	clock = pygame.time.Clock()
 
 	board = Board(width, height)
+	board.set_offset(delta_x, delta_y)
 
 	menu_opts = ["New CPU Game", "Player vs. Player", \
-			"Practice Mode", "Credits", "Quit Ceibal-Chess"]
+			"Practice Mode", "Credits", \
+			"Level: " + get_level(AppConfig.strength).name, "Quit Ceibal-Chess"]
 	menu = Menu(scr_h, scr_h, menu_opts)
 	menu.visible = True
 
@@ -100,6 +105,9 @@ def main(requested_w, requested_h):
 	#Create UI Elements:
 	turn_display = StatePanel(scr_w - scr_w/6, scr_h/40, 120, 120)
 
+	#Only the areas that changed are redrawn and sent to the display
+	dirty_rects = DirtyRects()
+
 	#Post an ACTIVEEVENT to render the first time
 	pygame.event.post(pygame.event.Event(pygame.ACTIVEEVENT))
 
@@ -126,11 +134,23 @@ def main(requested_w, requested_h):
 
 			if event.type == pygame.QUIT:
 				controller.shutdown()
+				engine_manager.shutdown()
 				sys.exit(0)
 
+			#The engine has an answer: play it now so it gets rendered
+			if event.type == ENGINE_EVENT and not menu.visible:
+				controller.update(0)
+
+			if event.type in (pygame.ACTIVEEVENT, pygame.VIDEOEXPOSE):
+				dirty_rects.invalidate()
+
 			if event.type == pygame.KEYDOWN:
 				if event.key == pygame.K_ESCAPE:
 					menu.toggle_visible()
+					controller.pause_clock(menu.visible)
+					dirty_rects.invalidate()
+				elif event.key == pygame.K_t:
+					AppConfig.show_threats = not AppConfig.show_threats
 				#else:
 				#	controller.shutdown()
 				#	sys.exit(0)
@@ -139,37 +159,54 @@ def main(requested_w, requested_h):
 				x, y = pygame.mouse.get_pos()
 
 				if not menu.visible:
-					clicked_cell = board.pick(x-delta_x, y-delta_y)
+					clicked_cell = board.pick(x, y)
 					controller.on_cell_clicked(clicked_cell)
 				else:
 					option = menu.on_click(x-delta_x, y-delta_y)
 					if option:
-						if option == menu_opts[4]:
+						if option == menu_opts[5]:
 							controller.shutdown()
+							engine_manager.shutdown()
 							sys.exit(0)
+						elif option == menu_opts[4]:
+							AppConfig.strength = next_level(AppConfig.strength).name
+							menu.set_option(4, "Level: " + AppConfig.strength)
+							controller.set_strength(AppConfig.strength)
 						elif option in menu_opts[0:2]:
 							game_mode = MODE_P_VS_CPU
 							if option == menu_opts[1]:
 								game_mode = MODE_P_VS_P
 							board = Board(width, height)
+							board.set_offset(delta_x, delta_y)
 							controller.shutdown("Started new game")
 							controller = BoardController(board, game_mode, game_code, logpath)
 							controller.init_board()
+							if controller.time_left() is None:
+								pygame.time.set_timer(CLOCK_EVENT, 0)
+							else:
+								pygame.time.set_timer(CLOCK_EVENT, 1000)
 							menu.visible = False
 							turn_display.set_state("move_white")
+							dirty_rects.invalidate()
 			if not menu.visible:
-				print "Checking if king is checkmated:"
+				print "Checking if the game is over:"
 				t_ini = time.time()
-				checkmated = board.king_is_checkmated(board.current_turn)
-				print "Check if checkmate for %s took %.5f secs" % \
-					(board.current_turn, time.time() - t_ini)
+				status = controller.update_game_state()
+				turn_display.set_times(controller.time_left())
+				print "Game status for %s: %s, took %.5f secs" % \
+					(board.current_turn, status, time.time() - t_ini)
 
-				if checkmated:
+				if status == "checkmate":
 					#print "Checkmate for", board.current_turn
 					#messenger.messages["check"] = game_messages["checkmate"]
-					controller.game_state = "checkmate"
 					turn_display.set_state("checkmate_" + board.current_turn)
 
+				elif controller.game_state == "draw":
+					turn_display.set_state("draw")
+
+				elif status == "timeout":
+					turn_display.set_state("timeout_" + board.current_turn)
+
 				elif board.king_is_checked(board.current_turn):
 					#messenger.messages["check"] = game_messages["check"]
 					turn_display.set_state("check_" + board.current_turn)
@@ -185,6 +222,7 @@ def main(requested_w, requested_h):
 			
 			#Dump move log and close IA
 			controller.shutdown(ex.message)	
+			engine_manager.shutdown()
 
 			#Dump trace to file
 			trace_file = open(os.path.join(logpath, game_code + ".trace"), "w")
@@ -201,31 +239,49 @@ def main(requested_w, requested_h):
 		#time visual update:
 		t_ini = time.time()
 
-		clear(screen)	
-		clear(surface)
-		
-		screen.blit(bg_img, bg_img.get_rect())
-		
-		board.render_background(surface)
-		
-		if controller.selected_cell is not None:
-			board.render_moves_for_piece_in_cell(surface, controller.selected_cell)
-			controller.selected_cell.render_foreground(surface)
-		
-		board.render_foreground(surface)
+		highlights = {}
+		if AppConfig.show_threats:
+			highlights = board.threat_highlights(board.current_turn)
+		selected = controller.selected_cell
+		if selected is not None and selected.piece is not None:
+			highlights.update(board.highlights(selected))
 
-		menu.render(surface)
+		if menu.visible:
+			dirty_rects.invalidate()
 
-		screen.blit(surface, sface_rect.move(delta_x, delta_y))
-		
-		if not menu.visible:
-			turn_display.render(screen)
-		
-		messenger.render_messages(screen)
+		if dirty_rects.full:
+			clear(screen)	
+			
+			screen.blit(bg_img, bg_img.get_rect())
+			
+			board.render(surface, highlights)
+
+			menu.render(surface)
+
+			screen.blit(surface, sface_rect.move(delta_x, delta_y))
+			
+			if not menu.visible:
+				turn_display.render(screen)
+			
+			messenger.render_messages(screen)
+		else:
+			#Send to the screen only the cells that look different
+			for i, j in board.render(surface, highlights):
+				rect = board.cell_rect(i, j)
+				cell_rect = board.screen_rect(i, j)
+				screen.blit(surface, cell_rect, rect)
+				dirty_rects.add(cell_rect)
+
+			if turn_display.dirty:
+				panel_rect = turn_display.get_rect()
+				screen.blit(bg_img, panel_rect, panel_rect)
+				turn_display.render(screen)
+				dirty_rects.add(panel_rect)
 		
-		update()
+		count = dirty_rects.update()
 		
-		print "Visual refresh took %.5f secs" % (time.time() - t_ini)
+		print "Visual refresh took %.5f secs (%s)" % (time.time() - t_ini, \
+			count and "%d areas" % count or "full screen")
 
 if __name__ == "__main__":
 	main(1000, 700)
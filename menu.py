@@ -17,7 +17,7 @@
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 #
 import pygame, os
-from resourcemanager import image_manager
+from resourcemanager import image_manager, text_manager
 
 class Menu:
 	def __init__(self, screen_w, screen_h, options):
@@ -33,7 +33,7 @@ class Menu:
 		self.bg_w = 2 * screen_w / 3
 		self.bg_h = 2 * screen_h / 3 + 20
 
-		self.font = None
+		self.font_size = 30
 
 		self.visible = False
 
@@ -46,6 +46,10 @@ class Menu:
 		for option in self.options:
 			self.option_coords.append((0,0))
 
+	def set_option(self, index, text):
+		'''Change the text of an option (e.g. one showing a setting).'''
+		self.options[index] = text
+
 	def toggle_visible(self):
 		if self.visible:
 			self.visible = False
@@ -56,10 +60,6 @@ class Menu:
 		if not self.visible:
 			return
 
-		if self.font is None:
-			#self.font = pygame.font.Font(None, 25)
-			self.font = pygame.font.Font(None, 30)
-
 		#Render bg:
 		bg_x = (self.scr_w - self.bg_w) / 2
 		bg_y = (self.scr_h - self.bg_h) / 2
@@ -75,13 +75,14 @@ class Menu:
 		#Render menu options:
 		entry_w = 2 * self.bg_w / 3
 		entry_x = bg_x + (self.bg_w - entry_w) / 2
-		entry_y = bg_y + (self.bg_h - (self.font.get_height()+ 40 + 20)*len(self.options)) / 2
+		font_h = text_manager.get_font(self.font_size).get_height()
+		entry_y = bg_y + (self.bg_h - (font_h + 40 + 20)*len(self.options)) / 2
 		#print "bg_h:", self.bg_h, "entries_height:", (self.font.get_height()+20)*len(self.options)
 
 		for i in range(0, len(self.options)):
 			option = self.options[i]
-			#text_sface = self.font.render(option, 1, (255, 255, 255))
-			text_sface = self.font.render(option, 1, (170, 88, 0))
+			#text_sface = text_manager.render(option, self.font_size, (255, 255, 255))
+			text_sface = text_manager.render(option, self.font_size, (170, 88, 0))
 
 			entry_h = text_sface.get_height() + 20
 
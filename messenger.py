@@ -18,6 +18,7 @@
 #
 
 import pygame
+from resourcemanager import text_manager
 
 #class DebugMessenger:
 #	def __init__(self):
@@ -55,13 +56,12 @@ class Messenger():
 	def __init__(self):
 		#print "creating new messenger"
 		self.messages = {}
-		self.font = None
+		self.font_size = 25
 
 	def render_messages(self, surface):
-		if self.font is None:
-			self.font = pygame.font.Font(None, 25)
 		for key,message in self.messages.iteritems():
-			text_sface = self.font.render(message.text, 1, message.color)
+			text_sface = text_manager.render(message.text, self.font_size, \
+					message.color)
 			surface.blit(text_sface, (message.x, message.y))
 
 messenger = Messenger()
@@ -0,0 +1,99 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Packed integer moves: one encoding for the engines, the caches, the
+transposition table and the opening book. A move fits in 16 bits:
+
+	bits 0-5	from square (bitboard numbering, a8 is 0)
+	bits 6-11	to square
+	bits 12-14	promotion piece code (see bitboard), 0 for none
+	bit 15		flag, free for the users of a code
+
+The flag is not part of the move: compare codes with MOVE_MASK applied
+when it may be set. 0 is never a move (from and to would be the same
+square) and stands for no move. Lists of codes are kept in array("H")
+buffers (see move_list), which take 2 bytes per move.'''
+from array import array
+from bitboard import *
+
+NO_MOVE = 0
+MOVE_FLAG = 1 << 15
+MOVE_MASK = MOVE_FLAG - 1
+
+SQUARE_NAMES = [square_name(sq) for sq in range(64)]
+
+#Promotion letters of the coordinate notation. Old GNU Chess versions
+#write "k" for a knight.
+PROMOTION_CODES = {"q" : QUEEN, "r" : ROOK, "b" : BISHOP, "n" : KNIGHT,
+		"k" : KNIGHT}
+
+def encode_move(move):
+	'''Pack a Position move, a (from, to, promotion) tuple. None is 
+	packed as NO_MOVE.'''
+	if move is None:
+		return NO_MOVE
+	frm, to, promo = move
+	return frm | to << 6 | (promo or 0) << 12
+
+def decode_move(code):
+	'''Unpack a code into a Position move, or None for NO_MOVE.'''
+	code &= MOVE_MASK
+	if not code:
+		return None
+	return (code & 63, (code >> 6) & 63, (code >> 12) & 7 or None)
+
+def move_list(moves = ()):
+	'''Pack Position moves into an array("H").'''
+	return array("H", [encode_move(move) for move in moves])
+
+def code_to_notation(code):
+	'''Coordinate notation of a code, as spoken by GNU Chess and the UCI
+	and xboard engines: "e2e4", "e7e8q".'''
+	text = SQUARE_NAMES[code & 63] + SQUARE_NAMES[(code >> 6) & 63]
+	promo = (code >> 12) & 7
+	if promo:
+		text += PIECE_CHARS[promo]
+	return text
+
+def notation_to_code(text):
+	'''Pack a move in coordinate notation. Raises ValueError if text is
+	not a move.'''
+	if len(text) not in (4, 5) or text[:2] not in SQUARE_NAMES or \
+		text[2:4] not in SQUARE_NAMES:
+		raise ValueError("Not a move: " + text)
+	code = SQUARE_NAMES.index(text[:2]) | SQUARE_NAMES.index(text[2:4]) << 6
+	if len(text) == 5:
+		try:
+			code |= PROMOTION_CODES[text[4].lower()] << 12
+		except KeyError:
+			raise ValueError("Not a move: " + text)
+	return code
+
+def code_to_game_move(code):
+	'''Translate a code into a Move or Crowning object.'''
+	#piece needs pygame: imported here so the headless tools (book and
+	#tablebase builders) can use this module without it
+	from piece import to_game_move
+	return to_game_move(decode_move(code))
+
+def game_move_to_code(move):
+	'''Pack a Move or Crowning object.'''
+	code = square(move.from_r, move.from_c) | square(move.to_r, move.to_c) << 6
+	if move.type == "Crowning":
+		code |= PIECE_CODES[move.piece] << 12
+	return code
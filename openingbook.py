@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Opening book: known replies for positions of the opening, looked up
+without asking the engine.
+
+The book file is a sorted array of 16 byte big endian entries:
+position hash (8 bytes, bitboard Zobrist key), move (2 bytes, packed
+by movecode.encode_move) and weight (2 bytes), plus 4 unused bytes.
+It is memory mapped and searched in place, so it costs no Python heap.
+Build it from a text file of opening lines:
+
+	python openingbook.py build data/openings.txt data/book.bin
+	python openingbook.py probe "<fen>"
+'''
+import sys, os, mmap, struct, random
+from bitboard import *
+from movecode import encode_move, decode_move
+
+ENTRY = struct.Struct(">QHH4x")
+
+class OpeningBook:
+	'''Read only view of a book file. The file is opened and mapped the
+	first time it is needed; a missing or empty file is an empty book.
+	Only one instance of this class should exist, opening_book.'''
+	def __init__(self, path):
+		self.path = path
+		self.data = None
+		self.size = None
+		self.random = random.Random()
+
+	def open(self):
+		self.size = 0
+		try:
+			book_file = open(self.path, "rb")
+			try:
+				if os.path.getsize(self.path) >= ENTRY.size:
+					self.data = mmap.mmap(book_file.fileno(), 0, \
+						access = mmap.ACCESS_READ)
+					self.size = len(self.data) / ENTRY.size
+			finally:
+				#The mapping stays valid after closing the file
+				book_file.close()
+		except (IOError, OSError, mmap.error), ex:
+			print "Cannot open opening book %s: %s" % (self.path, ex)
+		print "Opening book: %d entries" % self.size
+
+	def close(self):
+		if self.data is not None:
+			self.data.close()
+		self.data = None
+		self.size = None
+
+	def entries(self, key):
+		'''Return the (move, weight) pairs stored for key.'''
+		if self.size is None:
+			self.open()
+		lo, hi = 0, self.size
+		while lo < hi:
+			mid = (lo + hi) / 2
+			if ENTRY.unpack_from(self.data, mid * ENTRY.size)[0] < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		result = []
+		while lo < self.size:
+			entry_key, move, weight = ENTRY.unpack_from(self.data, lo * ENTRY.size)
+			if entry_key != key:
+				break
+			result.append((decode_move(move), weight))
+			lo += 1
+		return result
+
+	def moves(self, position):
+		'''Return the legal book moves of a Position with their weights.'''
+		legal = list(position.legal_moves())
+		return [(move, weight) for move, weight in self.entries(position.hash) \
+			if move in legal and weight > 0]
+
+	def choose(self, position):
+		'''Pick a book move for a Position at random, proportionally to
+		the weights. Returns None when the position is not in the book.'''
+		choices = self.moves(position)
+		total = sum([weight for move, weight in choices])
+		if not total:
+			return None
+		pick = self.random.randrange(total)
+		for move, weight in choices:
+			pick -= weight
+			if pick < 0:
+				return move
+
+def book_path():
+	try:
+		path = os.environ["SUGAR_BUNDLE_PATH"]
+	except:
+		path = ""
+	return os.path.join(path, "data", "book.bin")
+
+#OpeningBook singleton
+opening_book = OpeningBook(book_path())
+
+
+def parse_move(position, text):
+	'''Find the legal move of a Position written as "e2e4" or "e7e8q".'''
+	frm, to = parse_square(text[:2]), parse_square(text[2:4])
+	promo = None
+	if len(text) > 4:
+		promo = PIECE_CHARS.index(text[4].lower())
+	for move in position.legal_moves_from(frm):
+		if move[1] == to and move[2] == promo:
+			return move
+	raise ValueError("Illegal move " + text)
+
+def build(lines_path, book_path):
+	'''Write a book file from a text file of opening lines. Returns the
+	number of entries.'''
+	weights = {}
+	for number, line in enumerate(open(lines_path)):
+		line = line.split("#")[0].split()
+		position = from_fen(START_FEN)
+		for text in line:
+			try:
+				move = parse_move(position, text)
+			except ValueError, ex:
+				raise ValueError("%s:%d: %s" % (lines_path, number + 1, ex))
+			key = (position.hash, encode_move(move))
+			weights[key] = weights.get(key, 0) + 1
+			position.make_move(move)
+
+	entries = weights.items()
+	entries.sort()
+	out = open(book_path, "wb")
+	for (key, move), weight in entries:
+		out.write(ENTRY.pack(key, move, min(weight, 0xffff)))
+	out.close()
+	return len(entries)
+
+def main():
+	if len(sys.argv) == 4 and sys.argv[1] == "build":
+		print "%d entries written" % build(sys.argv[2], sys.argv[3])
+		return 0
+	if len(sys.argv) == 3 and sys.argv[1] == "probe":
+		position = from_fen(sys.argv[2])
+		for move, weight in opening_book.moves(position):
+			print move_name(move), weight
+		return 0
+	print __doc__
+	return 1
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Perft: count the leaf nodes of the legal move tree to a given depth.
+
+Comparing the counts against known values verifies the move generator
+(castling, en passant, promotions, pins...), and timing them measures its
+throughput. Runs headless, only the bitboard module is needed:
+
+	python perft.py                         run the bundled suite
+	python perft.py -d 4 "<fen>"            divide a single position
+'''
+import sys, time
+from optparse import OptionParser
+from bitboard import *
+
+#(name, fen, node counts for depth 1, 2, ...)
+SUITE = [
+	("start", START_FEN,
+		[20, 400, 8902, 197281, 4865609]),
+	("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+		[48, 2039, 97862, 4085603]),
+	("endgame-ep", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+		[14, 191, 2812, 43238, 674624]),
+	("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+		[6, 264, 9467, 422333]),
+	("discovered", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+		[44, 1486, 62379, 2103487]),
+	("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+		[46, 2079, 89890, 3894594]),
+]
+
+def perft(position, depth):
+	'''Count the leaf nodes of the legal move tree of the given depth.'''
+	if depth <= 0:
+		return 1
+	if depth == 1:
+		count = 0
+		for move in position.legal_moves():
+			count += 1
+		return count
+	nodes = 0
+	for move in list(position.legal_moves()):
+		undo = position.make_move(move)
+		nodes += perft(position, depth - 1)
+		position.unmake_move(undo)
+	return nodes
+
+def divide(position, depth):
+	'''Split the perft count by root move. Returns a list of
+	(move, nodes) pairs.'''
+	result = []
+	for move in list(position.legal_moves()):
+		undo = position.make_move(move)
+		result.append((move, perft(position, depth - 1)))
+		position.unmake_move(undo)
+	return result
+
+def timed_perft(position, depth):
+	'''Run divide and return (per move counts, total, seconds, nodes/sec).'''
+	t_ini = time.time()
+	split = divide(position, depth)
+	elapsed = time.time() - t_ini
+	total = sum([nodes for move, nodes in split])
+	return split, total, elapsed, total / max(elapsed, 1e-6)
+
+def run_suite(max_depth, verbose = False, out = sys.stdout):
+	'''Run perft on the bundled positions up to max_depth. Returns True
+	if every count matched.'''
+	ok = True
+	grand_nodes, grand_time = 0, 0.0
+	for name, fen, counts in SUITE:
+		position = from_fen(fen)
+		for depth in range(1, min(max_depth, len(counts)) + 1):
+			split, total, elapsed, nps = timed_perft(position, depth)
+			status = total == counts[depth - 1] and "ok" or \
+				"FAIL (expected %d)" % counts[depth - 1]
+			ok = ok and total == counts[depth - 1]
+			out.write("%-12s depth %d: %10d nodes %8.3f secs %9.0f nps  %s\n" % \
+				(name, depth, total, elapsed, nps, status))
+			if verbose:
+				for move, nodes in split:
+					out.write("    %s: %d\n" % (move_name(move), nodes))
+			grand_nodes += total
+			grand_time += elapsed
+	out.write("Total: %d nodes in %.3f secs (%.0f nps)\n" % \
+		(grand_nodes, grand_time, grand_nodes / max(grand_time, 1e-6)))
+	return ok
+
+def main():
+	parser = OptionParser(usage = "%prog [options] [fen]")
+	parser.add_option("-d", "--depth", type = "int", default = 3,
+		help = "search depth (default: 3)")
+	parser.add_option("-v", "--verbose", action = "store_true",
+		default = False, help = "print per move counts in suite mode")
+	options, args = parser.parse_args()
+
+	if not args:
+		if run_suite(options.depth, options.verbose):
+			return 0
+		return 1
+
+	position = from_fen(" ".join(args))
+	split, total, elapsed, nps = timed_perft(position, options.depth)
+	for move, nodes in split:
+		print "%s: %d" % (move_name(move), nodes)
+	print
+	print "Moves: %d" % len(split)
+	print "Nodes: %d" % total
+	print "Time: %.3f secs (%.0f nps)" % (elapsed, nps)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
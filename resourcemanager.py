@@ -18,6 +18,14 @@
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 #
 import pygame, os
+from bitboard import COLOR_NAMES, PIECE_NAMES
+from lrucache import LRUCache
+from appconfig import AppConfig
+
+def sprite_index(owner, type):
+	'''Index of the sprite of a piece in the piece atlas: white pawn,
+	knight, bishop, rook, queen and king, then the black ones.'''
+	return COLOR_NAMES.index(owner) * 6 + PIECE_NAMES.index(type) - 1
 
 class ImageManager:
 	'''Load and manage images, making them available through the applications.
@@ -30,6 +38,9 @@ class ImageManager:
 		this class should exist at any time, which is accessible as
 		the variable "imagemanager"'''
 		self.images = { }
+		self.atlas = None
+		self.atlas_rects = []
+		self.atlas_size = None
 	
 	def get_image(self, imgname):
 		'''Look for an image in the internal image dictionary. If the
@@ -48,5 +59,64 @@ class ImageManager:
 		self.images[imgname] = pygame.image.load(os.path.join(path, "data", imgname))
 		return self.images[imgname]
 
+	def get_atlas(self, cell_size):
+		'''Return the piece atlas for cells of the given size as a pair
+		(surface, rects): all 12 piece sprites scaled to cell_size and
+		side by side on a single surface, and the area of each one, by
+		sprite_index. The atlas is only rebuilt when the size changes.'''
+		if self.atlas is None or self.atlas_size != cell_size:
+			self.build_atlas(cell_size)
+		return self.atlas, self.atlas_rects
+
+	def build_atlas(self, cell_size):
+		scale = getattr(pygame.transform, "smoothscale", pygame.transform.scale)
+		atlas = pygame.Surface((cell_size * 12, cell_size), pygame.SRCALPHA, 32)
+		rects = []
+		for owner in COLOR_NAMES:
+			for type in PIECE_NAMES[1:]:
+				img = self.get_image(type + owner + ".png")
+				rect = pygame.Rect(len(rects) * cell_size, 0, cell_size, cell_size)
+				atlas.blit(scale(img, (cell_size, cell_size)), rect)
+				rects.append(rect)
+		if pygame.display.get_surface() is not None:
+			#Match the display's pixel format so blits need no conversion
+			atlas = atlas.convert_alpha()
+		self.atlas = atlas
+		self.atlas_rects = rects
+		self.atlas_size = cell_size
+
 #ImageManager singleton
 image_manager = ImageManager()
+
+
+class TextManager:
+	'''Render text through a cache of the rendered surfaces, keyed by
+	(font, size, text, color), so unchanged text is rasterized only once.
+	Text should be rendered with text_manager.render instead of calling
+	the render method of a pygame font.'''
+	
+	def __init__(self, max_size):
+		self.fonts = { }
+		self.cache = LRUCache(max_size)
+	
+	def get_font(self, size, name = None):
+		'''Return the pygame font of the given file name (None for the
+		default font) and size, loading it the first time.'''
+		try:
+			return self.fonts[(name, size)]
+		except KeyError:
+			font = pygame.font.Font(name, size)
+			self.fonts[(name, size)] = font
+			return font
+	
+	def render(self, text, size, color, name = None):
+		'''Return an antialiased surface with the given text.'''
+		key = (name, size, text, color)
+		text_sface = self.cache.get(key)
+		if text_sface is None:
+			text_sface = self.get_font(size, name).render(text, 1, color)
+			self.cache.put(key, text_sface)
+		return text_sface
+
+#TextManager singleton
+text_manager = TextManager(AppConfig.text_cache_size)
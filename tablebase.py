@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Endgame tablebases: win/draw/loss and distance to mate for every
+position of an ending with 3 or 4 pieces, computed offline by
+retrograde analysis and looked up during the game.
+
+A table is named by its material, strongest side first (KQK, KRK, KPK,
+KQKR, KBNK...). Its file, data/tb/<name>.tb, holds one byte per
+position (see TableLayout for the index), zlib compressed:
+0 is a draw, 1..127 a win for the side to move in that many moves and
+128 + n a loss in n moves (128: checkmated). Castling rights and en
+passant are not taken into account.
+
+	python tablebase.py KQK KRK KPK         generate tables (and the
+	                                         smaller ones they need)
+	python tablebase.py -p "<fen>"          probe a position
+'''
+import sys, os, zlib, multiprocessing
+from array import array
+from optparse import OptionParser
+from bitboard import *
+
+#Order of the pieces in a table name, strongest first
+NAME_PIECES = "QRBNP"
+NAME_TYPES = {"K" : KING, "Q" : QUEEN, "R" : ROOK, "B" : BISHOP,
+		"N" : KNIGHT, "P" : PAWN}
+
+#Endings that cannot be won, no table is needed for them
+DRAWN = ("KK", "KBK", "KNK")
+
+#Results, from the side to move's point of view
+WIN, DRAW, LOSS = "win", "draw", "loss"
+
+#Position status during generation
+UNKNOWN, WON, LOST, STALEMATE, ILLEGAL = 0, 1, 2, 3, 4
+
+def side_name(position, color):
+	'''"K" followed by color's other pieces, strongest first.'''
+	name = "K"
+	for char in NAME_PIECES:
+		name += char * count_bits(position.pieces[color][NAME_TYPES[char]])
+	return name
+
+def stronger(a, b):
+	'''Whether side name a should come before side name b.'''
+	if len(a) != len(b):
+		return len(a) > len(b)
+	for char_a, char_b in zip(a, b):
+		if char_a != char_b:
+			return NAME_PIECES.index(char_a) < NAME_PIECES.index(char_b)
+	return True
+
+def table_name(position):
+	'''Return (name, flipped) for the table of a Position. flipped is
+	True when black is the strong side: the table has it as white.'''
+	white, black = side_name(position, WHITE), side_name(position, BLACK)
+	if stronger(white, black):
+		return white + black, False
+	return black + white, True
+
+def result_of(value):
+	'''Translate a table byte to (result, moves to mate).'''
+	if value == 0:
+		return (DRAW, 0)
+	if value < 128:
+		return (WIN, value)
+	return (LOSS, value - 128)
+
+
+class TableLayout:
+	'''Index of the positions of one table. The pieces are numbered in
+	name order (strong side, which plays white, first) and the index is
+	side to move * 64^n + square of piece 0 * 64^(n-1) + ...
+	Pieces of the same kind and color are kept in increasing square
+	order, so every position has a single index.'''
+	def __init__(self, name):
+		self.name = name
+		weak = name.index("K", 1)
+		self.pieces = []
+		for k, char in enumerate(name):
+			color = WHITE
+			if k >= weak:
+				color = BLACK
+			self.pieces.append((color, NAME_TYPES[char]))
+		self.count = len(self.pieces)
+		self.size = 2 << (6 * self.count)
+		#Pairs of pieces that must be in increasing square order
+		self.twins = [(k, k + 1) for k in range(self.count - 1) \
+			if self.pieces[k] == self.pieces[k + 1]]
+
+	def index(self, squares, turn):
+		idx = turn
+		for sq in squares:
+			idx = idx << 6 | sq
+		return idx
+
+	def squares(self, idx):
+		'''Return (squares, side to move) for an index.'''
+		squares = []
+		for k in range(self.count):
+			squares.append(idx & 63)
+			idx >>= 6
+		squares.reverse()
+		return squares, idx
+
+	def canonical(self, squares):
+		for k, l in self.twins:
+			if squares[k] > squares[l]:
+				squares[k], squares[l] = squares[l], squares[k]
+		return squares
+
+	def position(self, squares, turn):
+		'''Build a Position, or return None if the squares do not make a
+		legal one.'''
+		if len(set(squares)) != self.count:
+			return None
+		for k, l in self.twins:
+			if squares[k] > squares[l]:
+				return None
+		position = Position()
+		position.castling = 0
+		for (color, ptype), sq in zip(self.pieces, squares):
+			if ptype == PAWN and sq >> 3 in (0, 7):
+				return None
+			position.put(sq, color, ptype)
+		position.set_turn(turn)
+		if position.in_check(turn ^ 1):
+			return None
+		return position
+
+	def index_of(self, position, flipped):
+		'''Index of a Position having this table's material.'''
+		squares = []
+		taken = 0
+		for color, ptype in self.pieces:
+			if flipped:
+				color ^= 1
+			bits = position.pieces[color][ptype] & ~taken
+			sq = lsb(bits)
+			taken |= 1 << sq
+			if flipped:
+				sq ^= 56
+			squares.append(sq)
+		turn = position.turn
+		if flipped:
+			turn ^= 1
+		return self.index(self.canonical(squares), turn)
+
+
+class Tablebases:
+	'''Access to the table files in a directory. Tables are loaded the
+	first time they are needed; missing tables make probe return None.
+	Only one instance of this class should exist, tablebases.'''
+	def __init__(self, path):
+		self.path = path
+		self.tables = {}
+
+	def table(self, name):
+		if name not in self.tables:
+			data = None
+			try:
+				table_file = open(os.path.join(self.path, name + ".tb"), "rb")
+				data = zlib.decompress(table_file.read())
+				table_file.close()
+			except (IOError, zlib.error):
+				pass
+			self.tables[name] = data
+		return self.tables[name]
+
+	def probe(self, position):
+		'''Exact result of a Position with up to 4 pieces: a (result,
+		moves to mate) pair for the side to move, result being WIN, DRAW
+		or LOSS. Returns None if there is no table for it.'''
+		if count_bits(position.occupied[WHITE] | position.occupied[BLACK]) > 4:
+			return None
+		name, flipped = table_name(position)
+		if name in DRAWN:
+			return (DRAW, 0)
+		data = self.table(name)
+		if data is None:
+			return None
+		return result_of(ord(data[TableLayout(name).index_of(position, flipped)]))
+
+	def best_move(self, position):
+		'''The move keeping the best result: the fastest mate when
+		winning, the longest resistance when losing. Returns None if the
+		position (or one after a move) is not in the tables.'''
+		best, best_key = None, None
+		for move in list(position.legal_moves()):
+			undo = position.make_move(move)
+			answer = self.probe(position)
+			position.unmake_move(undo)
+			if answer is None:
+				return None
+			result, moves = answer
+			#Sort key: the opponent's loss (our win), fastest first, then
+			#draws, then the opponent's win, slowest first
+			if result == LOSS:
+				key = (0, moves)
+			elif result == DRAW:
+				key = (1, 0)
+			else:
+				key = (2, -moves)
+			if best_key is None or key < best_key:
+				best, best_key = move, key
+		return best
+
+def tables_path():
+	try:
+		path = os.environ["SUGAR_BUNDLE_PATH"]
+	except:
+		path = ""
+	return os.path.join(path, "data", "tb")
+
+#Tablebases singleton
+tablebases = Tablebases(tables_path())
+
+
+def needed_tables(name):
+	'''Tables reached from name by a capture or a promotion.'''
+	weak = name.index("K", 1)
+	sides = [name[:weak], name[weak:]]
+	needed = set()
+	for k in (0, 1):
+		for l, char in enumerate(sides[k]):
+			if char == "K":
+				continue
+			#char is captured
+			rest = list(sides)
+			rest[k] = sides[k][:l] + sides[k][l + 1:]
+			needed.add(tuple(rest))
+			if char == "P":
+				for promo in "QRBN":
+					rest = list(sides)
+					rest[k] = "K" + "".join(sorted(sides[k][1:l] + promo + \
+						sides[k][l + 1:], key = NAME_PIECES.index))
+					needed.add(tuple(rest))
+	names = set()
+	for white, black in needed:
+		if stronger(white, black):
+			names.add(white + black)
+		else:
+			names.add(black + white)
+	return names.difference(DRAWN)
+
+def _init_chunk(args):
+	'''First pass over the indices start..end of a table: find illegal
+	positions, mates and stalemates, count the moves staying in the table
+	and look up the result of those leaving it (captures, promotions).'''
+	name, path, start, end = args
+	layout = TableLayout(name)
+	probe = Tablebases(path).probe
+	status = array("B", [ILLEGAL]) * (end - start)
+	counts = array("B", [0]) * (end - start)
+	dists = array("H", [0]) * (end - start)
+	seeds = []
+	for idx in xrange(start, end):
+		squares, turn = layout.squares(idx)
+		position = layout.position(squares, turn)
+		if position is None:
+			continue
+		k = idx - start
+		status[k] = UNKNOWN
+		occ = position.occupied[WHITE] | position.occupied[BLACK]
+		moves = list(position.legal_moves())
+		if not moves:
+			if position.in_check(turn):
+				seeds.append((0, idx, LOST))
+			else:
+				status[k] = STALEMATE
+			continue
+		win = None
+		for move in moves:
+			if move[2] is None and not occ & (1 << move[1]):
+				counts[k] += 1
+				continue
+			undo = position.make_move(move)
+			answer = probe(position)
+			position.unmake_move(undo)
+			if answer is None:
+				raise Exception("Table needed for %s is missing" % name)
+			result, mate = answer
+			if result == LOSS:
+				if win is None or 2 * mate + 1 < win:
+					win = 2 * mate + 1
+			elif result == DRAW:
+				#Never decremented: this position cannot be lost
+				counts[k] += 1
+			else:
+				dists[k] = max(dists[k], 2 * mate)
+		if win is not None:
+			seeds.append((win, idx, WON))
+		elif counts[k] == 0:
+			seeds.append((dists[k], idx, LOST))
+	return start, status, counts, dists, seeds
+
+def predecessors(layout, idx):
+	'''Indices of the positions from which a move leads to idx without
+	capturing or promoting.'''
+	squares, turn = layout.squares(idx)
+	mover = turn ^ 1
+	position = layout.position(squares, turn)
+	occ = position.occupied[WHITE] | position.occupied[BLACK]
+	result = []
+	for k, (color, ptype) in enumerate(layout.pieces):
+		if color != mover:
+			continue
+		sq = squares[k]
+		if ptype == PAWN:
+			step = 8
+			if color == BLACK:
+				step = -8
+			origins = []
+			if not occ & (1 << (sq + step)) and (sq + step) >> 3 not in (0, 7):
+				origins.append(sq + step)
+				start_row = 4
+				if color == BLACK:
+					start_row = 3
+				if sq >> 3 == start_row and not occ & (1 << (sq + 2 * step)):
+					origins.append(sq + 2 * step)
+		else:
+			origins = iter_squares(position.piece_attacks(sq) & ~occ)
+		for origin in origins:
+			before = squares[:]
+			before[k] = origin
+			before = layout.canonical(before)
+			#The side now to move must not have been left in check
+			position.remove(sq)
+			position.put(origin, color, ptype)
+			legal = not position.in_check(turn)
+			position.remove(origin)
+			position.put(sq, color, ptype)
+			if legal:
+				result.append(layout.index(before, mover))
+	return result
+
+def generate(name, path, processes = None, out = sys.stdout):
+	'''Compute a table by retrograde analysis and write it to path.'''
+	layout = TableLayout(name)
+	out.write("%s: %d positions\n" % (name, layout.size))
+	chunk = max(4096, layout.size / 64)
+	jobs = [(name, path, start, min(start + chunk, layout.size)) \
+		for start in range(0, layout.size, chunk)]
+
+	status = array("B")
+	counts = array("B")
+	dists = array("H")
+	buckets = {}
+	pool = multiprocessing.Pool(processes)
+	for start, part_status, part_counts, part_dists, seeds in pool.imap(_init_chunk, jobs):
+		status.extend(part_status)
+		counts.extend(part_counts)
+		dists.extend(part_dists)
+		for dist, idx, kind in seeds:
+			buckets.setdefault(dist, []).append((idx, kind))
+	pool.close()
+	pool.join()
+
+	#Resolve positions by increasing distance to mate (in plies). A
+	#lost position makes its predecessors won one ply later; a won one
+	#takes a move away from its predecessors, which are lost once they
+	#have no moves left that are not losing.
+	dist = 0
+	while buckets:
+		for idx, kind in buckets.pop(dist, []):
+			if status[idx] != UNKNOWN:
+				continue
+			status[idx] = kind
+			dists[idx] = dist
+			for before in predecessors(layout, idx):
+				if status[before] != UNKNOWN:
+					continue
+				if kind == LOST:
+					buckets.setdefault(dist + 1, []).append((before, WON))
+				else:
+					counts[before] -= 1
+					dists[before] = max(dists[before], dist + 1)
+					if counts[before] == 0:
+						buckets.setdefault(dists[before], []).append((before, LOST))
+		dist += 1
+
+	data = array("B", [0]) * layout.size
+	won = lost = 0
+	for idx in xrange(layout.size):
+		if status[idx] == WON:
+			data[idx] = (dists[idx] + 1) / 2
+			won += 1
+		elif status[idx] == LOST:
+			data[idx] = 128 + dists[idx] / 2
+			lost += 1
+	out.write("%s: %d won, %d lost, longest mate %d plies\n" % \
+		(name, won, lost, dist - 1))
+	table_file = open(os.path.join(path, name + ".tb"), "wb")
+	table_file.write(zlib.compress(data.tostring(), 9))
+	table_file.close()
+
+def generate_all(names, path, processes = None, out = sys.stdout):
+	'''Generate the tables in names and those they depend on, smallest
+	first. Existing files are kept.'''
+	done = set()
+	def visit(name):
+		if name in done:
+			return
+		done.add(name)
+		for needed in sorted(needed_tables(name)):
+			visit(needed)
+		if not os.path.exists(os.path.join(path, name + ".tb")):
+			generate(name, path, processes, out)
+	for name in names:
+		visit(name)
+
+def main():
+	parser = OptionParser(usage = "%prog [options] TABLE...")
+	parser.add_option("-d", "--dir", default = tables_path(),
+		help = "table directory (default: data/tb)")
+	parser.add_option("-j", "--processes", type = "int", default = None,
+		help = "worker processes (default: one per core)")
+	parser.add_option("-p", "--probe", metavar = "FEN",
+		help = "look a position up instead")
+	options, args = parser.parse_args()
+
+	if options.probe:
+		position = from_fen(options.probe)
+		book = Tablebases(options.dir)
+		print book.probe(position)
+		move = book.best_move(position)
+		print move and move_name(move)
+		return 0
+	if not args:
+		parser.print_help()
+		return 1
+	if not os.path.isdir(options.dir):
+		os.makedirs(options.dir)
+	generate_all(args, options.dir, options.processes)
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Unit tests for the rules outside the move generator (perft.py covers
+that one): move codes, position keys, draws by repetition and by the
+fifty-move rule and the endgame tablebases.
+
+	python test_rules.py
+
+The Board and game move tests need pygame and are skipped without it.'''
+import unittest
+from bitboard import *
+from movecode import *
+from tablebase import tablebases, WIN, DRAW, LOSS
+
+try:
+	import pygame
+	from board import Board
+	from piece import Move, Crowning
+except ImportError:
+	pygame = None
+
+
+class MoveCodeTest(unittest.TestCase):
+	def test_round_trip(self):
+		'''Every legal move of a few positions survives encoding, and
+		so does its coordinate notation.'''
+		for fen in (START_FEN,
+			"r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+			"r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1"):
+			for move in from_fen(fen).legal_moves():
+				code = encode_move(move)
+				self.assertNotEqual(code, NO_MOVE)
+				self.assertEqual(code & MOVE_MASK, code)
+				self.assertEqual(decode_move(code), move)
+				self.assertEqual(decode_move(code | MOVE_FLAG), move)
+				self.assertEqual(notation_to_code(code_to_notation(code)), code)
+
+	def test_no_move(self):
+		self.assertEqual(encode_move(None), NO_MOVE)
+		self.assertEqual(decode_move(NO_MOVE), None)
+
+	def test_notation(self):
+		self.assertEqual(notation_to_code("e2e4"),
+			encode_move((parse_square("e2"), parse_square("e4"), None)))
+		code = notation_to_code("e7e8q")
+		self.assertEqual(decode_move(code),
+			(parse_square("e7"), parse_square("e8"), QUEEN))
+		self.assertEqual(code_to_notation(code), "e7e8q")
+		#Old GNU Chess knight promotions
+		self.assertEqual(notation_to_code("a2a1k"), notation_to_code("a2a1n"))
+		for text in ("", "e2", "e2e9", "i2e4", "e7e8x", "e2e4qq"):
+			self.assertRaises(ValueError, notation_to_code, text)
+
+	def test_move_list(self):
+		moves = list(from_fen(START_FEN).legal_moves())
+		codes = move_list(moves)
+		self.assertEqual(codes.itemsize, 2)
+		self.assertEqual([decode_move(code) for code in codes], moves)
+
+	@unittest.skipIf(pygame is None, "needs pygame")
+	def test_game_moves(self):
+		'''Position moves, Move/Crowning objects and codes translate
+		into each other.'''
+		position = from_fen("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 b kq - 0 1")
+		promotions = 0
+		for move in position.legal_moves():
+			code = encode_move(move)
+			game_move = code_to_game_move(code)
+			if move[2]:
+				promotions += 1
+				self.assertTrue(isinstance(game_move, Crowning))
+			else:
+				self.assertTrue(isinstance(game_move, Move))
+			self.assertEqual(game_move_to_code(game_move), code)
+		self.assertEqual(promotions, 8)
+
+
+class PositionKeyTest(unittest.TestCase):
+	def play(self, fen, *moves):
+		position = from_fen(fen)
+		for text in moves:
+			position.make_move(decode_move(notation_to_code(text)))
+		return position
+
+	def test_fen_round_trip(self):
+		'''A position set up from its FEN has the key make_move gave it.'''
+		for fen, moves in ((START_FEN, ("e2e4",)),
+				(START_FEN, ("e2e4", "g8f6", "e4e5", "d7d5")),
+				(START_FEN, ("g1f3", "d7d5", "e2e4", "d5d4", "c2c4")),
+				("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1", ("e2e4",))):
+			position = self.play(fen, *moves)
+			copy = from_fen(position.fen())
+			self.assertEqual(copy.hash, position.hash)
+			self.assertEqual(copy.ep, position.ep)
+
+	def test_useless_en_passant_square(self):
+		'''An en passant square no pawn can take on does not change the
+		key.'''
+		after_e4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq %s 0 1"
+		position = from_fen(after_e4 % "e3")
+		self.assertEqual(position.ep, None)
+		self.assertEqual(position.hash, from_fen(after_e4 % "-").hash)
+		self.assertEqual(position.hash, self.play(START_FEN, "e2e4").hash)
+		#Here the d4 pawn can take
+		position = from_fen("4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1")
+		self.assertEqual(position.ep, parse_square("e3"))
+		self.assertNotEqual(position.hash,
+			from_fen("4k3/8/8/8/3pP3/8/8/4K3 b - - 0 1").hash)
+
+
+@unittest.skipIf(pygame is None, "needs pygame")
+class DrawTest(unittest.TestCase):
+	def setUp(self):
+		self.board = Board(400, 400)
+
+	def set_fen(self, fen):
+		self.board.position.set_fen(fen)
+		self.board.sync_cells()
+		self.board.start_history()
+
+	def play(self, *moves):
+		'''Play moves given in coordinate notation.'''
+		for text in moves:
+			frm, to, promo = decode_move(notation_to_code(text))
+			i, j = coords(frm)
+			dest_i, dest_j = coords(to)
+			self.assertTrue(self.board.move_piece_in_cell_to(
+				self.board[i][j], dest_i, dest_j))
+
+	def test_repetition(self):
+		self.set_fen(START_FEN)
+		shuffle = ("g1f3", "g8f6", "f3g1", "f6g8")
+		self.play(*shuffle)
+		self.assertEqual(self.board.game_status(), "playing")
+		self.play(*shuffle)
+		self.assertEqual(self.board.game_status(), "repetition")
+
+	def test_repetition_not_in_a_row(self):
+		'''The three occurrences do not need to be consecutive.'''
+		self.set_fen("4k3/8/8/8/8/8/8/R3K3 w - - 0 1")
+		self.play("a1a2", "e8d8", "a2a1", "d8e8", "e1d1", "e8d8",
+			"d1e1", "d8e8")
+		#The starting position, with other moves in between
+		self.assertEqual(self.board.game_status(), "repetition")
+
+	def test_irreversible_move_clears_repetitions(self):
+		self.set_fen(START_FEN)
+		self.play("g1f3", "g8f6", "f3g1", "f6g8", "e2e4", "e7e5")
+		self.play("g1f3", "g8f6", "f3g1", "f6g8")
+		self.assertEqual(self.board.game_status(), "playing")
+
+	def test_fifty_moves(self):
+		self.set_fen("4k3/8/8/8/8/8/4P3/R3K3 w - - 0 1")
+		shuffle = ("a1a2", "e8d8", "a2a3", "d8e8", "a3a4", "e8d8",
+			"a4a1", "d8e8")
+		for n in range(12):
+			self.play(*shuffle)
+		self.assertEqual(self.board.halfmove_clock, 96)
+		#A pawn move restarts the count
+		self.play("e2e3", "e8d8")
+		self.assertEqual(self.board.halfmove_clock, 1)
+		self.board.halfmove_clock = 98
+		self.play("a1a2")
+		self.assertEqual(self.board.game_status(), "playing")
+		self.play("d8e8")
+		self.assertEqual(self.board.game_status(), "fifty_moves")
+
+	def test_checkmate_is_not_a_draw(self):
+		'''Mate on the hundredth halfmove wins the game.'''
+		self.set_fen("7k/8/6K1/8/8/8/8/R7 w - - 0 1")
+		self.board.halfmove_clock = 99
+		self.play("a1a8")
+		self.assertEqual(self.board.game_status(), "checkmate")
+
+
+class TablebaseTest(unittest.TestCase):
+	def probe(self, fen):
+		return tablebases.probe(from_fen(fen))
+
+	def test_trivial_draws(self):
+		self.assertEqual(self.probe("8/8/3k4/8/8/3K4/8/8 w - - 0 1"), (DRAW, 0))
+		self.assertEqual(self.probe("8/8/3k4/8/8/3K4/3N4/8 w - - 0 1"), (DRAW, 0))
+
+	def test_too_many_pieces(self):
+		self.assertEqual(self.probe(START_FEN), None)
+		self.assertEqual(self.probe("8/8/3k4/8/8/3K4/2QRB3/8 w - - 0 1"), None)
+
+	def test_kqk(self):
+		#Qg8 or Qa7 mates
+		self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1"), (WIN, 1))
+		self.assertEqual(self.probe("k5Q1/8/1K6/8/8/8/8/8 b - - 0 1"), (LOSS, 0))
+		#Stalemate
+		self.assertEqual(self.probe("k7/8/1Q6/8/8/8/8/2K5 b - - 0 1"), (DRAW, 0))
+		#The queen hangs
+		self.assertEqual(self.probe("8/8/8/3k4/3Q4/8/8/7K b - - 0 1"), (DRAW, 0))
+		#Black is the strong side: the table is probed flipped
+		self.assertEqual(self.probe("K7/8/1k6/8/8/8/8/6q1 b - - 0 1"), (WIN, 1))
+
+	def test_krk(self):
+		result, moves = self.probe("8/8/8/4k3/8/8/8/R3K3 w - - 0 1")
+		self.assertEqual(result, WIN)
+		self.assertTrue(1 < moves <= 16)
+		self.assertEqual(self.probe("R3k3/8/4K3/8/8/8/8/8 b - - 0 1"), (LOSS, 0))
+
+	def test_kpk(self):
+		#Whoever has the opposition decides the game
+		self.assertEqual(self.probe("8/4k3/8/4K3/4P3/8/8/8 w - - 0 1"), (DRAW, 0))
+		self.assertEqual(self.probe("8/4k3/8/4K3/4P3/8/8/8 b - - 0 1")[0], LOSS)
+		#King on the sixth rank in front of its pawn: always wins
+		self.assertEqual(self.probe("4k3/8/4K3/4P3/8/8/8/8 w - - 0 1")[0], WIN)
+		self.assertEqual(self.probe("4k3/8/4K3/4P3/8/8/8/8 b - - 0 1")[0], LOSS)
+		#Rook pawn with the defender in the corner
+		self.assertEqual(self.probe("k7/8/8/K7/P7/8/8/8 w - - 0 1"), (DRAW, 0))
+
+	def test_best_move(self):
+		position = from_fen("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1")
+		position.make_move(tablebases.best_move(position))
+		self.assertEqual(tablebases.probe(position), (LOSS, 0))
+		self.assertEqual(tablebases.best_move(from_fen(START_FEN)), None)
+
+
+if __name__ == "__main__":
+	unittest.main()
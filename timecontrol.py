@@ -0,0 +1,152 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+'''Strength levels, the game clock and the time manager that turns both
+into search limits for each engine move.'''
+import time
+from engineprotocol import SearchLimits
+from appconfig import AppConfig
+
+#Every engine move gets at least this many milliseconds
+MIN_THINK_MS = 50
+
+#Share of the remaining clock spent on a move: 1 / MOVES_TO_GO
+MOVES_TO_GO = 30
+
+#With less than this left on the clock the engine moves almost at once
+EMERGENCY_MS = 10000
+
+class StrengthLevel:
+	'''A named playing strength: depth (plies), nodes and movetime
+	(milliseconds) limits for each engine move. None means no limit.'''
+	def __init__(self, name, depth, nodes, movetime):
+		self.name = name
+		self.depth = depth
+		self.nodes = nodes
+		self.movetime = movetime
+
+LEVELS = [
+	StrengthLevel("Beginner", 1, 500, 250),
+	StrengthLevel("Easy", 2, 5000, 500),
+	StrengthLevel("Medium", 4, 30000, 2000),
+	StrengthLevel("Hard", 6, 200000, 5000),
+	StrengthLevel("Expert", None, None, 10000),
+]
+
+def get_level(name):
+	'''Find a level by name. Unknown names get the Medium level.'''
+	for level in LEVELS:
+		if level.name == name:
+			return level
+	return LEVELS[2]
+
+def next_level(name):
+	'''The level after name, going back to the first one after the last.'''
+	index = LEVELS.index(get_level(name))
+	return LEVELS[(index + 1) % len(LEVELS)]
+
+
+class GameClock:
+	'''Chess clock with increment. Times are in milliseconds. Only one
+	side's clock runs at a time; stopping it adds the increment.'''
+	def __init__(self, base_ms, increment_ms = 0):
+		self.remaining = {"white" : base_ms, "black" : base_ms}
+		self.increment = increment_ms
+		self.running = None
+		self.started = 0.0
+		self.paused = None
+
+	def start(self, color):
+		'''Stop the running clock and start color's.'''
+		self.stop()
+		self.paused = None
+		self.running = color
+		self.started = time.time()
+
+	def stop(self):
+		if self.running is None:
+			return
+		left = self.time_left(self.running)
+		self.remaining[self.running] = left + self.increment
+		self.running = None
+
+	def pause(self):
+		'''Stop the running clock without adding the increment, until
+		resume.'''
+		if self.running is None:
+			return
+		self.remaining[self.running] = self.time_left(self.running)
+		self.paused, self.running = self.running, None
+
+	def resume(self):
+		'''Restart the clock stopped by pause.'''
+		if self.paused is None:
+			return
+		self.running, self.paused = self.paused, None
+		self.started = time.time()
+
+	def time_left(self, color):
+		left = self.remaining[color]
+		if color == self.running:
+			left -= int((time.time() - self.started) * 1000)
+		return max(0, left)
+
+	def flagged(self, color):
+		'''Whether color has run out of time.'''
+		return self.time_left(color) == 0
+
+
+class TimeManager:
+	'''Decide how long the engine may think on each move. The strength
+	level sets the usual budget, the game clock (if any) shrinks it as
+	time runs out, and nothing may go past max_think_ms: the hard cap
+	for slow machines (AppConfig.max_think_ms by default).'''
+	def __init__(self, level, clock = None, max_think_ms = None):
+		self.level = level
+		self.clock = clock
+		if max_think_ms is None:
+			max_think_ms = AppConfig.max_think_ms
+		self.max_think_ms = max_think_ms
+
+	def budget(self, color):
+		'''Milliseconds color's engine should spend on its next move.'''
+		budget = self.level.movetime or self.max_think_ms
+		if self.clock is not None:
+			left = self.clock.time_left(color)
+			increment = self.clock.increment
+			share = left / MOVES_TO_GO + increment * 3 / 4
+			if left < EMERGENCY_MS:
+				#Keep a reserve for the rest of the game
+				share = min(share, left / 20 + increment / 2)
+			budget = min(budget, share)
+		return max(MIN_THINK_MS, min(budget, self.max_think_ms))
+
+	def cutoff(self, color):
+		'''Emergency limit in milliseconds: an engine still thinking by
+		then is told to move at once.'''
+		return min(2 * self.budget(color), self.max_think_ms)
+
+	def limits(self, color):
+		'''SearchLimits for color's next engine move.'''
+		limits = SearchLimits(self.level.depth, self.budget(color), \
+				self.level.nodes)
+		if self.clock is not None:
+			limits.wtime = self.clock.time_left("white")
+			limits.btime = self.clock.time_left("black")
+			limits.winc = limits.binc = self.clock.increment
+		return limits
@@ -0,0 +1,109 @@
+#
+#    Ceibal Chess - A chess activity for Sugar.
+#    Copyright (C) 2008, 2009 Alejandro Segovia <asegovi@gmail.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+#
+from array import array
+from movecode import encode_move, decode_move
+
+#Bound types:
+EXACT, LOWER, UPPER = 0, 1, 2
+
+#Bytes used by one entry: check key (4), depth (1), bound (1),
+#score (4) and move (2)
+ENTRY_SIZE = 12
+
+class TranspositionTable:
+	'''Fixed size table of search results keyed by position hash.
+
+	Entries live in flat arrays instead of Python objects, so the memory
+	used is known in advance: size_mb megabytes. The table is split in
+	buckets of two entries: the first one keeps the deepest search seen
+	for its bucket, the second one is always replaced.
+	The low bits of the key select the bucket and the high 32 bits are
+	stored to tell positions sharing a bucket apart.'''
+
+	def __init__(self, size_mb = 2):
+		buckets = 1
+		while buckets * 4 * ENTRY_SIZE <= size_mb * 1024 * 1024:
+			buckets *= 2
+		self.mask = buckets - 1
+		self.size = buckets * 2
+
+		self.checks = array("I", [0]) * self.size
+		self.depths = array("b", [-1]) * self.size
+		self.bounds = array("b", [0]) * self.size
+		self.scores = array("i", [0]) * self.size
+		self.moves = array("H", [0]) * self.size
+
+		self.probes = 0
+		self.hits = 0
+		self.stores = 0
+		self.collisions = 0
+		self.used = 0
+
+	def clear(self):
+		self.depths = array("b", [-1]) * self.size
+		self.used = 0
+
+	def probe(self, key):
+		'''Look key up. Returns (depth, score, bound, move) or None.'''
+		self.probes += 1
+		check = key >> 32
+		slot = (key & self.mask) << 1
+		if self.checks[slot] != check or self.depths[slot] < 0:
+			slot += 1
+			if self.checks[slot] != check or self.depths[slot] < 0:
+				return None
+		self.hits += 1
+		return (self.depths[slot], self.scores[slot], self.bounds[slot],
+			decode_move(self.moves[slot]))
+
+	def store(self, key, depth, score, bound, move):
+		'''Store a search result for key.'''
+		self.stores += 1
+		check = key >> 32
+		slot = (key & self.mask) << 1
+		old_depth = self.depths[slot]
+		if not (old_depth < 0 or self.checks[slot] == check or depth >= old_depth):
+			slot += 1
+			old_depth = self.depths[slot]
+
+		if old_depth < 0:
+			self.used += 1
+		elif self.checks[slot] != check:
+			self.collisions += 1
+		elif move is None:
+			#Keep the best move of a previous search of this position
+			move = decode_move(self.moves[slot])
+
+		self.checks[slot] = check
+		self.depths[slot] = min(depth, 127)
+		self.scores[slot] = score
+		self.bounds[slot] = bound
+		self.moves[slot] = encode_move(move)
+
+	def memory(self):
+		'''Bytes taken by the entries.'''
+		return self.size * ENTRY_SIZE
+
+	def stats(self):
+		'''Return a dictionary with the table counters.'''
+		return {"size" : self.size, "bytes" : self.memory(),
+			"probes" : self.probes, "hits" : self.hits,
+			"hit_rate" : self.probes and float(self.hits) / self.probes or 0.0,
+			"stores" : self.stores, "collisions" : self.collisions,
+			"fill" : float(self.used) / self.size}
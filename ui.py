@@ -17,7 +17,7 @@
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 #
 import pygame, os
-from resourcemanager import image_manager
+from resourcemanager import image_manager, text_manager
 
 class StatePanel:
 	'''Shows the current game state in a panel. The displayed game state 
@@ -32,15 +32,33 @@ class StatePanel:
 		self.state = "move_white"
 		self.x, self.y, self.w, self.h = x, y, w, h
 		self.loaded = False
+		self.dirty = True
+		self.times = None
 	
 	def set_state(self, state):
 		'''Set the state to the given parameter.
 		Valid states are: move_white, move_black, check_white, check_black,
-		checkmate_white and checkmate_black .'''
+		checkmate_white, checkmate_black, timeout_white, timeout_black
+		and draw.'''
 		if not state in ["move_white", "move_black", "check_white", \
-				"check_black", "checkmate_white", "checkmate_black"]:
+				"check_black", "checkmate_white", "checkmate_black", \
+				"timeout_white", "timeout_black", "draw"]:
 			raise Exception("Invalid State: " + state)
-		self.state = state
+		if state != self.state:
+			self.state = state
+			self.dirty = True
+
+	def set_times(self, times):
+		'''Show the time left on the game clock: a (white, black) pair of
+		milliseconds, or None for games without a clock.'''
+		if times is not None:
+			times = "%s  %s" % (format_time(times[0]), format_time(times[1]))
+		if times != self.times:
+			self.times = times
+			self.dirty = True
+
+	def get_rect(self):
+		return pygame.Rect(self.x, self.y, self.w, self.h)
 	
 	def initialize(self):
 		'''Initialize Fonts, Images, etc.'''
@@ -57,12 +75,22 @@ class StatePanel:
 				"check_white" : king_white, \
 				"check_black" : king_black, \
 				"checkmate_white" : king_white, \
-				"checkmate_black" : king_black }
+				"checkmate_black" : king_black, \
+				"timeout_white" : king_white, \
+				"timeout_black" : king_black }
 		
-		font = pygame.font.Font(None, 25)
-		self.turn_text = font.render("Current Turn:", 1, (255, 255, 255))
-		self.check_text = font.render("Check:", 1, (255, 255, 0))
-		self.mate_text = font.render("Checkmate:", 1, (255, 20, 20))
+		#Both kings side by side for a draw:
+		kw, kh = king_white.get_width(), king_white.get_height()
+		draw_img = pygame.Surface((2 * kw, kh), pygame.SRCALPHA, 32)
+		draw_img.blit(king_white, (0, 0))
+		draw_img.blit(king_black, (kw, 0))
+		self.turn_imgs["draw"] = pygame.transform.scale(draw_img, (kw, kh / 2))
+		
+		self.turn_text = text_manager.render("Current Turn:", 25, (255, 255, 255))
+		self.check_text = text_manager.render("Check:", 25, (255, 255, 0))
+		self.mate_text = text_manager.render("Checkmate:", 25, (255, 20, 20))
+		self.draw_text = text_manager.render("Draw", 25, (120, 200, 255))
+		self.timeout_text = text_manager.render("Out of time:", 25, (255, 20, 20))
 		
 		self.loaded = True
 	
@@ -71,6 +99,7 @@ class StatePanel:
 		
 		if not self.loaded:
 			self.initialize()
+		self.dirty = False
 		
 		x,y,w,h = self.x, self.y, self.w, self.h
 		
@@ -80,10 +109,54 @@ class StatePanel:
 			surface.blit(self.turn_text, (x+(w-self.turn_text.get_width())/2.0, w/5.5))
 		elif self.state in ["check_white", "check_black"]:
 			surface.blit(self.check_text, (x+(w-self.check_text.get_width())/2.0, w/5.5))
+		elif self.state == "draw":
+			surface.blit(self.draw_text, (x+(w-self.draw_text.get_width())/2.0, w/5.5))
+		elif self.state in ["timeout_white", "timeout_black"]:
+			surface.blit(self.timeout_text, (x+(w-self.timeout_text.get_width())/2.0, w/5.5))
 		else:
 			surface.blit(self.mate_text, (x+(w-self.mate_text.get_width())/2.0, w/5.5))
 		
 		img = self.turn_imgs[self.state]
 		iw, ih = img.get_width(), img.get_height()
 		surface.blit(img, pygame.Rect(x + (w-iw)/2, y + (h-ih)/2, iw, ih))
-	
\ No newline at end of file
+		
+		if self.times is not None:
+			times_text = text_manager.render(self.times, 20, (255, 255, 255))
+			surface.blit(times_text, (x+(w-times_text.get_width())/2.0, \
+				y+h-times_text.get_height()-4))
+	
+
+
+def format_time(ms):
+	'''Clock display of a time in milliseconds: "m:ss".'''
+	seconds = (ms + 999) / 1000
+	return "%d:%02d" % (seconds / 60, seconds % 60)
+
+
+class DirtyRects:
+	'''Screen areas changed since the last display update. Only those 
+	are sent to the display, unless the whole screen was invalidated.'''
+
+	def __init__(self):
+		self.rects = []
+		self.full = True
+
+	def add(self, rect):
+		self.rects.append(rect)
+
+	def invalidate(self):
+		'''Redraw the whole screen on the next update.'''
+		self.full = True
+
+	def update(self):
+		'''Push the changed areas to the display. Returns how many 
+		rectangles were updated (0 for a full flip).'''
+		count = len(self.rects)
+		if self.full:
+			pygame.display.flip()
+			count = 0
+		elif self.rects:
+			pygame.display.update(self.rects)
+		self.rects = []
+		self.full = False
+		return count